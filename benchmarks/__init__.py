@@ -0,0 +1,5 @@
+# -*- coding: ascii -*-
+"""
+Benchmarks do pipeline com faturas sinteticas (synthetic), uma engine sem
+Paddle (stub) e o executor dos cenarios (run). Uso: python -m benchmarks.
+"""
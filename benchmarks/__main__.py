@@ -0,0 +1,7 @@
+# -*- coding: ascii -*-
+import sys
+
+from .run import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# -*- coding: ascii -*-
+"""
+Replay de fixtures gravadas (enel_ocr.recording) pelos mappers, sem OCR:
+
+    python -m benchmarks record fixtures/ -n 500
+    python -m benchmarks mappers fixtures/ --repeat 5 -o mappers.json
+
+record gera as fixtures a partir das faturas sinteticas (pela camada de
+texto, ou pela engine com --ocr); fixtures de faturas reais saem do
+pipeline com RECORD_DIR ou --record-dir. mappers mede o tempo e a memoria
+alocada por chamada de cada mapper e confere se o Invoice mapeado ainda e o
+gravado na fixture.
+"""
+from __future__ import annotations
+
+import json
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from enel_ocr import pipeline
+from enel_ocr.mappers import credit_info, tariff_flags
+from enel_ocr.recording import Fixture, iter_fixtures, record_invoice
+from enel_ocr.serialization import invoice_to_dict
+
+from .synthetic import synthetic_invoices
+
+# Chamada pronta de um mapper: recebe nada, devolve nada.
+_Call = Callable[[], None]
+
+
+def record_fixtures(
+    directory: str,
+    count: int,
+    engine=None,
+    scanned: bool = False,
+) -> int:
+    """Grava count faturas sinteticas; sem engine, le a camada de texto."""
+    options = pipeline.PipelineOptions(
+        text_layer=engine is None, record_dir=directory
+    )
+    for pdf_bytes in synthetic_invoices(count, scanned=scanned):
+        pipeline.run_pipeline(pdf_bytes, engine, options)
+    return count
+
+
+def _handler_call(handler, layout_id: str, texts, boxes) -> _Call:
+    def call() -> None:
+        handler(pipeline._InvoiceFields(layout_id), texts, boxes)
+
+    return call
+
+
+def _calls(fixtures: Iterable[Fixture]) -> Dict[str, List[_Call]]:
+    calls: dict[str, list[_Call]] = {}
+    for fixture in fixtures:
+        fields = pipeline._InvoiceFields(fixture.layout_id)
+        for region, result in zip(fixture.regions, fixture.results):
+            texts, boxes, _scores = result
+            handler = pipeline._HANDLERS.get(region.description)
+            if handler is None:
+                continue
+            call = _handler_call(handler, fixture.layout_id, texts, boxes)
+            calls.setdefault(region.description, []).append(call)
+            handler(fields, texts, boxes)
+        # Bandeiras e creditos saem da mensagem ja mapeada.
+        message = fields.important_message
+        if message:
+            calls.setdefault("tariff_flags", []).append(
+                lambda message=message: tariff_flags.map(message)
+            )
+            calls.setdefault("credit_info", []).append(
+                lambda message=message: credit_info.map(message)
+            )
+    return calls
+
+
+def _timings(calls: List[_Call], repeat: int) -> List[float]:
+    durations = []
+    for _ in range(repeat):
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _allocations(calls: List[_Call]) -> Tuple[float, float]:
+    # Pico de memoria alocada durante cada chamada: media e maior, em KiB.
+    peaks = []
+    for call in calls:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    return statistics.fmean(peaks) / 1024, max(peaks) / 1024
+
+
+def _mismatches(fixtures: Iterable[Fixture], update: bool) -> List[str]:
+    changed = []
+    for fixture in fixtures:
+        invoice = pipeline._build_invoice(
+            fixture.layout_id, fixture.regions, fixture.results
+        )
+        expected = json.dumps(fixture.invoice, sort_keys=True)
+        if json.dumps(invoice_to_dict(invoice), sort_keys=True) == expected:
+            continue
+        changed.append(str(fixture.path))
+        if update:
+            record_invoice(
+                fixture.path.parent,
+                fixture.layout_id,
+                fixture.regions,
+                fixture.results,
+                invoice,
+            )
+    return changed
+
+
+def replay_fixtures(
+    paths: Iterable[str], repeat: int = 1, update: bool = False
+) -> dict:
+    """Tempo e memoria por mapper e as fixtures cujo Invoice mudou."""
+    fixtures = list(iter_fixtures(paths))
+    calls = _calls(fixtures)
+    mappers = {}
+    tracemalloc.start()
+    try:
+        allocations = {
+            name: _allocations(items) for name, items in calls.items()
+        }
+    finally:
+        tracemalloc.stop()
+    for name, items in sorted(calls.items()):
+        durations = sorted(_timings(items, max(repeat, 1)))
+        mean_kib, peak_kib = allocations[name]
+        mappers[name] = {
+            "calls": len(durations),
+            "mean_us": round(statistics.fmean(durations) * 1e6, 2),
+            "p95_us": round(durations[int(0.95 * (len(durations) - 1))] * 1e6, 2),
+            "total_ms": round(sum(durations) * 1000, 3),
+            "mean_alloc_kib": round(mean_kib, 2),
+            "peak_alloc_kib": round(peak_kib, 2),
+        }
+    return {
+        "fixtures": len(fixtures),
+        "repeat": repeat,
+        "mappers": mappers,
+        "mismatches": _mismatches(fixtures, update),
+    }
@@ -0,0 +1,386 @@
+# -*- coding: ascii -*-
+"""
+Roda os cenarios de benchmark e compara resultados entre versoes:
+
+    python -m benchmarks run -n 40 -o resultados.json
+    python -m benchmarks compare base.json resultados.json
+    python -m benchmarks record fixtures/ -n 500
+    python -m benchmarks mappers fixtures/ -o mappers.json
+
+Cada cenario roda num processo novo (o pico de RSS e so dele) e mede a
+latencia de uma fatura por vez, o tempo de cada estagio (pelas metricas de
+enel_ocr.metrics), a vazao com varias threads, cada uma com sua engine, e a
+vazao do pipeline em estagios (run_pipeline_stream) com uma engine. record e
+mappers gravam e reproduzem a saida do OCR pelos mappers (benchmarks.mappers).
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import platform
+import queue
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from enel_ocr import metrics
+from enel_ocr.pipeline import PipelineOptions, run_pipeline, run_pipeline_stream
+
+from .mappers import record_fixtures, replay_fixtures
+from .synthetic import synthetic_invoices
+
+SCENARIOS: Dict[str, PipelineOptions] = {
+    "crop": PipelineOptions(),
+    "crop-trim": PipelineOptions(trim=True),
+    "crop-gray": PipelineOptions(grayscale=True),
+    "bands": PipelineOptions(ocr_mode="bands"),
+    "page": PipelineOptions(ocr_mode="page"),
+    "text-layer": PipelineOptions(text_layer=True),
+}
+
+
+@dataclass(frozen=True)
+class EngineConfig:
+    kind: str = "stub"
+    cpu_threads: int | None = None
+    det_ms: float = 0.0
+    rec_ms: float = 0.0
+    det_mpx_ms: float = 0.0
+
+    def create(self):
+        if self.kind == "paddle":
+            from enel_ocr.ocr.engine import init_ocr
+
+            return init_ocr(cpu_threads=self.cpu_threads)
+        from .stub import StubEngine
+
+        return StubEngine(
+            det_ms=self.det_ms, rec_ms=self.rec_ms, det_mpx_ms=self.det_mpx_ms
+        )
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    options: dict
+    invoices: int
+    latency_ms: Dict[str, float]
+    stages_ms: Dict[str, float]
+    throughput: Dict[str, float] = field(default_factory=dict)
+    stream_invoices_per_s: float = 0.0
+    peak_rss_mb: float = 0.0
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _stage_totals() -> Dict[str, List[float]]:
+    totals: dict[str, list[float]] = {}
+    histograms = metrics.REGISTRY.snapshot()["histograms"]
+    for name, labels, _buckets, total, count in histograms:
+        if name == "stage_seconds":
+            totals[labels["stage"]] = [total, count]
+    return totals
+
+
+def _throughput(
+    pdfs: List[bytes], engine: EngineConfig, options: PipelineOptions, threads: int
+) -> float:
+    engines: queue.Queue = queue.Queue()
+    for _ in range(threads):
+        engines.put(engine.create())
+
+    def work(pdf_bytes: bytes) -> None:
+        ocr = engines.get()
+        try:
+            run_pipeline(pdf_bytes, ocr, options)
+        finally:
+            engines.put(ocr)
+
+    # Pelo menos 4 faturas por thread para a medida nao ser so o arranque.
+    work_items = pdfs * max(1, -(-threads * 4 // len(pdfs)))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(work, work_items))
+    return len(work_items) / (time.perf_counter() - start)
+
+
+def run_scenario(
+    name: str,
+    options: PipelineOptions,
+    pdfs: List[bytes],
+    engine: EngineConfig,
+    concurrency: Sequence[int],
+) -> dict:
+    ocr = engine.create()
+    # Aquece a engine e os caches de modulo antes de medir.
+    run_pipeline(pdfs[0], ocr, options)
+
+    before = _stage_totals()
+    latencies = []
+    for pdf_bytes in pdfs:
+        start = time.perf_counter()
+        run_pipeline(pdf_bytes, ocr, options)
+        latencies.append((time.perf_counter() - start) * 1000)
+    stages = {}
+    for stage, (total, count) in _stage_totals().items():
+        previous_total = before.get(stage, [0.0, 0])[0]
+        # Tempo medio do estagio por fatura.
+        stages[stage] = round((total - previous_total) * 1000 / len(pdfs), 3)
+
+    throughput = {
+        str(threads): round(_throughput(pdfs, engine, options, threads), 3)
+        for threads in concurrency
+    }
+    start = time.perf_counter()
+    for _invoice in run_pipeline_stream(pdfs, ocr, options):
+        pass
+    stream = len(pdfs) / (time.perf_counter() - start)
+
+    result = ScenarioResult(
+        name=name,
+        options=asdict(options),
+        invoices=len(pdfs),
+        latency_ms={
+            "mean": round(statistics.fmean(latencies), 3),
+            "p50": round(_percentile(latencies, 0.5), 3),
+            "p95": round(_percentile(latencies, 0.95), 3),
+            "max": round(max(latencies), 3),
+        },
+        stages_ms=stages,
+        throughput=throughput,
+        stream_invoices_per_s=round(stream, 3),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+    )
+    return asdict(result)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(
+    scenarios: Sequence[str],
+    count: int,
+    engine: EngineConfig,
+    concurrency: Sequence[int],
+    scanned: bool = False,
+) -> dict:
+    pdfs = list(synthetic_invoices(count, scanned=scanned))
+    results = []
+    context = get_context("spawn")
+    for name in scenarios:
+        # Processo novo por cenario: pico de RSS e caches nao vazam entre eles.
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            future = pool.submit(
+                run_scenario, name, SCENARIOS[name], pdfs, engine, concurrency
+            )
+            results.append(future.result())
+        print(f"{name}: {results[-1]['latency_ms']['p50']} ms p50", file=sys.stderr)
+    return {
+        "meta": {
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "engine": asdict(engine),
+            "invoices": count,
+            "scanned": scanned,
+            "concurrency": list(concurrency),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(base: dict, current: dict, threshold: float) -> List[str]:
+    """Linhas com as regressoes acima de threshold (fracao) entre dois resultados."""
+    regressions = []
+    base_scenarios = {item["name"]: item for item in base["scenarios"]}
+    for item in current["scenarios"]:
+        old = base_scenarios.get(item["name"])
+        if old is None:
+            continue
+        # (metrica, valor antigo, novo, maior e pior?)
+        checks = [
+            *(
+                (f"latency_ms.{key}", old["latency_ms"][key], value, True)
+                for key, value in item["latency_ms"].items()
+                if key in ("p50", "p95")
+            ),
+            ("peak_rss_mb", old["peak_rss_mb"], item["peak_rss_mb"], True),
+            (
+                "stream_invoices_per_s",
+                old["stream_invoices_per_s"],
+                item["stream_invoices_per_s"],
+                False,
+            ),
+        ]
+        for threads, value in item["throughput"].items():
+            if threads in old["throughput"]:
+                checks.append(
+                    (f"throughput.{threads}", old["throughput"][threads], value, False)
+                )
+        for metric, before, after, higher_is_worse in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            if (change > threshold) if higher_is_worse else (change < -threshold):
+                regressions.append(
+                    f"{item['name']} {metric}: {before} -> {after} ({change:+.1%})"
+                )
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks do pipeline com faturas sinteticas.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="roda os cenarios e grava JSON")
+    run.add_argument("-n", "--invoices", type=int, default=20)
+    run.add_argument("-o", "--output", help="arquivo JSON (padrao: stdout)")
+    run.add_argument(
+        "-s",
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="cenario a rodar (repetivel; padrao: todos)",
+    )
+    run.add_argument("--engine", choices=("stub", "paddle"), default="stub")
+    run.add_argument("--cpu-threads", type=int, default=0)
+    run.add_argument(
+        "--concurrency",
+        type=_int_list,
+        default=[1, 2, 4],
+        help="threads da medida de vazao, separadas por virgula (padrao: 1,2,4)",
+    )
+    run.add_argument(
+        "--scanned", action="store_true", help="faturas so com imagem, sem texto"
+    )
+    run.add_argument("--stub-det-ms", type=float, default=0.0)
+    run.add_argument("--stub-rec-ms", type=float, default=0.0)
+    run.add_argument(
+        "--stub-det-mpx-ms",
+        type=float,
+        default=0.0,
+        help="custo da deteccao por megapixel da imagem (mede o ganho do trim)",
+    )
+
+    diff = commands.add_parser("compare", help="compara dois resultados")
+    diff.add_argument("base")
+    diff.add_argument("current")
+    diff.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="piora tolerada, em fracao (padrao: 0.10)",
+    )
+    record = commands.add_parser(
+        "record", help="grava fixtures de OCR das faturas sinteticas"
+    )
+    record.add_argument("directory")
+    record.add_argument("-n", "--invoices", type=int, default=200)
+    record.add_argument(
+        "--ocr",
+        choices=("stub", "paddle"),
+        help="passa pela engine em vez de ler a camada de texto",
+    )
+    record.add_argument("--scanned", action="store_true")
+
+    replay = commands.add_parser("mappers", help="roda as fixtures pelos mappers")
+    replay.add_argument("paths", nargs="+", help="fixtures .json ou diretorios")
+    replay.add_argument("--repeat", type=int, default=3)
+    replay.add_argument("-o", "--output", help="arquivo JSON (padrao: stdout)")
+    replay.add_argument(
+        "--update",
+        action="store_true",
+        help="regrava o Invoice esperado das fixtures que mudaram",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        engine = EngineConfig(kind=args.ocr).create() if args.ocr else None
+        count = record_fixtures(
+            args.directory, max(args.invoices, 1), engine, scanned=args.scanned
+        )
+        print(f"{count} faturas gravadas em {args.directory}", file=sys.stderr)
+        return 0
+
+    if args.command == "mappers":
+        results = replay_fixtures(args.paths, args.repeat, update=args.update)
+        results = {
+            "meta": {
+                "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+            },
+            **results,
+        }
+        _write(json.dumps(results, indent=2), args.output)
+        for path in results["mismatches"]:
+            print(f"invoice diferente: {path}", file=sys.stderr)
+        return 1 if results["mismatches"] and not args.update else 0
+
+    if args.command == "compare":
+        base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+        current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+        regressions = compare(base, current, args.threshold)
+        for line in regressions:
+            print(line)
+        return 1 if regressions else 0
+
+    engine = EngineConfig(
+        kind=args.engine,
+        cpu_threads=args.cpu_threads or None,
+        det_ms=args.stub_det_ms,
+        rec_ms=args.stub_rec_ms,
+        det_mpx_ms=args.stub_det_mpx_ms,
+    )
+    results = run_benchmarks(
+        args.scenario or list(SCENARIOS),
+        max(args.invoices, 1),
+        engine,
+        [threads for threads in args.concurrency if threads > 0],
+        scanned=args.scanned,
+    )
+    _write(json.dumps(results, indent=2), args.output)
+    return 0
+
+
+def _write(payload: str, output: str | None) -> None:
+    if output:
+        Path(output).write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
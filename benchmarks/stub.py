@@ -0,0 +1,79 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from enel_ocr.ocr.engine import OcrResult
+
+# Pixels mais escuros que isso contam como texto na deteccao do stub.
+INK_LEVEL = 128
+SCORE = 0.99
+# Lado maior da imagem que chega ao detector do Paddle (det_limit_side_len).
+DET_LIMIT_SIDE = 960
+
+
+class StubEngine:
+    """
+    Engine sem Paddle para medir render, recorte, lotes e mappers. A
+    deteccao separa as linhas de texto pela projecao horizontal da tinta e o
+    reconhecimento devolve um texto fixo por linha. det_ms e rec_ms simulam o
+    custo do modelo por imagem e por linha; det_mpx_ms, por megapixel da
+    imagem ja reduzida a DET_LIMIT_SIDE, como o detector do Paddle (time.sleep
+    libera o GIL, como a inferencia).
+    """
+
+    def __init__(
+        self, det_ms: float = 0.0, rec_ms: float = 0.0, det_mpx_ms: float = 0.0
+    ) -> None:
+        self.det_ms = det_ms
+        self.rec_ms = rec_ms
+        self.det_mpx_ms = det_mpx_ms
+
+    def _det_seconds(self, image: np.ndarray) -> float:
+        height, width = image.shape[:2]
+        scale = min(1.0, DET_LIMIT_SIDE / max(height, width, 1))
+        megapixels = height * width * scale * scale / 1e6
+        return (self.det_ms + self.det_mpx_ms * megapixels) / 1000
+
+    def _lines(self, image: np.ndarray) -> List[List[List[float]]]:
+        # Texto preto sobre branco: um canal basta e nao copia a imagem.
+        gray = image if image.ndim == 2 else image[:, :, 0]
+        ink = gray < INK_LEVEL
+        rows = ink.any(axis=1)
+        boxes = []
+        # Inicio e fim de cada sequencia de linhas de pixels com tinta.
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+        for top, bottom in zip(edges[::2], edges[1::2]):
+            columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+            left, right = float(columns[0]), float(columns[-1] + 1)
+            top, bottom = float(top), float(bottom)
+            boxes.append([[left, top], [right, top], [right, bottom], [left, bottom]])
+        return boxes
+
+    def ocr_batch(
+        self, images: Sequence[np.ndarray], single_line: Sequence[bool]
+    ) -> List[OcrResult]:
+        results: List[OcrResult] = []
+        for image, is_single_line in zip(images, single_line):
+            if is_single_line:
+                height, width = image.shape[:2]
+                boxes = [[[0.0, 0.0], [width, 0.0], [width, height], [0.0, height]]]
+            else:
+                if self.det_ms or self.det_mpx_ms:
+                    time.sleep(self._det_seconds(image))
+                boxes = self._lines(image)
+            if self.rec_ms and boxes:
+                time.sleep(self.rec_ms * len(boxes) / 1000)
+            texts = [f"LINHA {index + 1}" for index in range(len(boxes))]
+            results.append((texts, boxes, [SCORE] * len(boxes)))
+        return results
+
+    def ocr(self, image: np.ndarray, cls: bool = False) -> list:
+        # Mesmo formato de PaddleOCR.ocr, para run_ocr.
+        del cls
+        texts, boxes, scores = self.ocr_batch([image], [False])[0]
+        lines = zip(texts, boxes, scores)
+        return [[[box, (text, score)] for text, box, score in lines]]
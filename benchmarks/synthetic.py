@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Faturas sinteticas para benchmarks: texto desenhado nas coordenadas das
+regioes de enel_ocr/layouts (v1 e v2), com os rotulos dos cabecalhos de
+deteccao, tabelas de itens, medidores e tributos e a mensagem com bandeiras
+e creditos. Com scanned=True a pagina vira uma imagem sem camada de texto,
+como uma fatura escaneada.
+"""
+from __future__ import annotations
+
+import random
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from enel_ocr.coords import Coordinates
+from enel_ocr.ocr.pdf import DEFAULT_DPI
+from enel_ocr.registry import get_registry
+
+# Pagina A4 em pixels a DEFAULT_DPI, o sistema de coordenadas dos layouts.
+PAGE_SIZE = (2480, 3508)
+FONT = "helv"
+_PX = 72.0 / DEFAULT_DPI
+
+Rect = Tuple[int, int, int, int]
+
+
+def _points(rect: Rect) -> fitz.Rect:
+    x, y, width, height = rect
+    return fitz.Rect(x, y, x + width, y + height) * _PX
+
+
+def _text_box(page: fitz.Page, rect: Rect, lines: Sequence[str]) -> None:
+    # Maior fonte (ate 9 pt) em que o texto cabe na regiao.
+    text = "\n".join(lines)
+    for fontsize in (9, 8, 7, 6, 5, 4):
+        shape = page.new_shape()
+        left = shape.insert_textbox(
+            _points(rect), text, fontsize=fontsize, fontname=FONT
+        )
+        if left >= 0:
+            shape.commit()
+            return
+    raise ValueError(f"texto nao cabe na regiao {rect}")
+
+
+def _table(
+    page: fitz.Page,
+    rect: Rect,
+    top: int,
+    columns: Sequence[int],
+    rows: Sequence[Sequence[str]],
+    row_height: int = 34,
+    fontsize: float = 5.5,
+) -> int:
+    """Desenha as linhas com as celulas nos x de columns; devolve o y final."""
+    x = rect[0]
+    y = top
+    for row in rows:
+        for column, cell in zip(columns, row):
+            point = fitz.Point(x + column, y + row_height * 0.75) * _PX
+            page.insert_text(point, cell, fontsize=fontsize, fontname=FONT)
+        y += row_height
+    return y
+
+
+def _money(rng: random.Random, low: float, high: float) -> str:
+    value = f"{rng.uniform(low, high):,.2f}"
+    return value.replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _digits(rng: random.Random, count: int) -> str:
+    return "".join(str(rng.randrange(10)) for _ in range(count))
+
+
+def _date(rng: random.Random, month: int, year: int = 2024) -> str:
+    return f"{rng.randint(1, 28):02d}/{month:02d}/{year}"
+
+
+def _simple_texts(layout_id: str, rng: random.Random) -> Dict[str, List[str]]:
+    month = rng.randint(1, 12)
+    installation = _digits(rng, 10)
+    customer = _digits(rng, 8)
+    first_name = rng.choice(["MARIA", "JOSE", "ANA", "FRANCISCO", "ANTONIA"])
+    last_name = rng.choice(["SILVA", "SOUZA", "OLIVEIRA", "LIMA", "PEREIRA"])
+    texts = {
+        "CLASSIFICACAO_UNIDADE_CONSUMIDORA": ["B1 RESIDENCIAL CONVENCIONAL"],
+        "TIPO_FORNECIMENTO": [rng.choice(["MONOFÁSICO", "BIFÁSICO", "TRIFÁSICO"])],
+        "NUMERO_INSTALACAO": [installation],
+        "NUMERO_CLIENTE": [customer],
+        "PERIODO_FATURAMENTO": [f"{month:02d}/2024"],
+        "DATA_VENCIMENTO": [_date(rng, month)],
+        "VALOR_PAGAR": [f"R$ {_money(rng, 50, 900)}"],
+        "LEITURA_ANTERIOR": [_date(rng, month)],
+        "LEITURA_ATUAL": [_date(rng, month)],
+        "PROXIMA_LEITURA": [_date(rng, month)],
+        "DIAS_LEITURA": [str(rng.randint(28, 33))],
+        "DADOS_PESSOAIS": [
+            f"{first_name} {last_name} DOS SANTOS",
+            f"RUA {rng.randint(1, 99)} DE MAIO, {rng.randint(1, 2000)}",
+            "CENTRO FORTALEZA CE",
+            f"CEP 60{_digits(rng, 3)}-{_digits(rng, 3)}",
+            "CPF {}.{}.{}-{}".format(*(_digits(rng, size) for size in (3, 3, 3, 2))),
+        ],
+        "RESPONSAVEL_PELA_ILUMINACAO": ["MUNICÍPIO DE FORTALEZA"],
+        "INFORMACOES_TRIBUTARIAS": [
+            f"NOTA FISCAL Nº {_digits(rng, 9)} - SÉRIE 001",
+            f"DATA DE EMISSÃO: {_date(rng, month)}",
+            "CHAVE DE ACESSO:",
+            " ".join(_digits(rng, 4) for _ in range(11)),
+            "CFOP 5258",
+            f"DATA DE APRESENTAÇÃO: {_date(rng, month)}",
+        ],
+        "MENSAGEM_IMPORTANTE": [
+            f"BANDEIRA TARIFÁRIA: VERDE 01/{month:02d} - 15/{month:02d} "
+            f"AMARELA 16/{month:02d} - 28/{month:02d}.",
+            f"ENERGIA INJETADA HFP NO MÊS: {_money(rng, 10, 300)} KWH "
+            f"SALDO UTILIZADO NO MÊS: {_money(rng, 10, 300)} KWH "
+            f"SALDO ATUALIZADO: {_money(rng, 10, 300)} KWH "
+            f"SALDO A EXPIRAR NO PRÓXIMO MÊS: {_money(rng, 0, 50)} KWH",
+            "CONSUMO FATURADO CONFORME RESOLUÇÃO NORMATIVA ANEEL 1000/2021.",
+        ],
+    }
+    if layout_id == "v2":
+        # No v2 instalacao e cliente dividem uma regiao e o periodo vem rotulado.
+        texts["NUMERO_INSTALACAO"] = [f"{installation} / {customer}"]
+        del texts["NUMERO_CLIENTE"]
+        texts["PERIODO_FATURAMENTO"] = ["MÊS/ANO", f"{month:02d}/2024"]
+    return texts
+
+
+def _draw_billing(page: fitz.Page, region: Coordinates, rng: random.Random) -> None:
+    rect = (region.x, region.y, region.width, region.height)
+    columns = [10, 420, 520, 640, 790, 920, 1030, 1160, 1260, 1360]
+    header = [
+        "Itens da Fatura",
+        "Unid.",
+        "Quant.",
+        "Preço unit",
+        "Valor (R$)",
+        "PIS/COFINS",
+        "Base Calc.",
+        "Alíquota",
+        "ICMS",
+        "Tarifa",
+    ]
+    items = []
+    for name in ("CONSUMO", "ADICIONAL BANDEIRA AMARELA", "CIP ILUM PUB PREF MUNIC"):
+        quantity = rng.randint(80, 600)
+        items.append(
+            [
+                name,
+                "KWH",
+                f"{quantity},00",
+                _money(rng, 0.5, 1.2),
+                _money(rng, 20, 500),
+                _money(rng, 1, 30),
+                _money(rng, 20, 500),
+                "20,00",
+                _money(rng, 4, 100),
+                _money(rng, 0.4, 0.9),
+            ]
+        )
+    y = _table(page, rect, region.y + 10, columns, [header, *items])
+
+    meter_columns = [10, 180, 360, 520, 680, 840, 1000, 1160, 1330]
+    meter_header = [
+        "Medidor",
+        "Horário/Segmento",
+        "Data",
+        "Leitura",
+        "Data",
+        "Leitura",
+        "Fator Multiplicador",
+        "Consumo kWh",
+        "Dias",
+    ]
+    previous = rng.randint(1000, 9000)
+    consumed = rng.randint(80, 600)
+    meter_row = [
+        _digits(rng, 8),
+        "TOTAL",
+        _date(rng, 1),
+        str(previous),
+        _date(rng, 2),
+        str(previous + consumed),
+        "1",
+        str(consumed),
+        str(rng.randint(28, 33)),
+    ]
+    y = _table(
+        page,
+        rect,
+        y + 60,
+        [10],
+        [["EQUIPAMENTOS DE MEDIÇÃO E CONSUMO NO PERÍODO"]],
+    )
+    _table(page, rect, y, meter_columns, [meter_header, meter_row])
+
+
+def _draw_taxes(page: fitz.Page, region: Coordinates, rng: random.Random) -> None:
+    rect = (region.x, region.y, region.width, region.height)
+    columns = [10, 130, 260, 350]
+    rows = [["Tributos", "Base Cálc.", "Alíquota", "Valor"]]
+    for name, rate in (("PIS", "0,89"), ("COFINS", "4,12"), ("ICMS", "20,00")):
+        rows.append([name, _money(rng, 50, 500), rate, _money(rng, 1, 100)])
+    _table(page, rect, region.y + 10, columns, rows)
+
+
+def _draw_headers(page: fitz.Page, layout_id: str) -> None:
+    rule = get_registry().header(layout_id)
+    if rule is None or rule.region is None:
+        return
+    x, y, width, _height = rule.region
+    if layout_id == "v1":
+        # Rotulos acima dos valores de instalacao e cliente.
+        _text_box(page, (x + 12, y + 20, width - 20, 50), ["INSTALAÇÃO"])
+        _text_box(page, (x + 12, y + 140, width - 20, 50), ["Nº DO CLIENTE"])
+    else:
+        _text_box(page, (x, y, width, 40), ["MÊS/ANO"])
+
+
+def synthetic_invoice(
+    layout_id: str = "v1", seed: int = 0, scanned: bool = False
+) -> bytes:
+    """PDF de uma pagina com o texto de cada regiao do layout."""
+    rng = random.Random(f"{layout_id}:{seed}")
+    document = fitz.open()
+    width, height = PAGE_SIZE
+    page = document.new_page(width=width * _PX, height=height * _PX)
+    texts = _simple_texts(layout_id, rng)
+    for region in get_registry().regions(layout_id):
+        if region.page != 1:
+            continue
+        if region.description == "DESCRICAO_FATURAMENTO":
+            _draw_billing(page, region, rng)
+        elif region.description == "TRIBUTOS":
+            _draw_taxes(page, region, rng)
+        elif region.description in texts:
+            rect = (region.x, region.y, region.width, region.height)
+            _text_box(page, rect, texts.pop(region.description))
+    _draw_headers(page, layout_id)
+    if scanned:
+        document = _rasterize(document)
+    try:
+        return document.tobytes(garbage=3, deflate=True)
+    finally:
+        document.close()
+
+
+def _rasterize(document: fitz.Document) -> fitz.Document:
+    scanned = fitz.open()
+    for page in document:
+        pix = page.get_pixmap(dpi=DEFAULT_DPI)
+        target = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        target.insert_image(target.rect, stream=pix.tobytes("jpeg"))
+    document.close()
+    return scanned
+
+
+def synthetic_invoices(
+    count: int, layouts: Sequence[str] = ("v1", "v2"), scanned: bool = False
+) -> Iterator[bytes]:
+    """count faturas alternando os layouts, sempre as mesmas para o mesmo count."""
+    for index in range(count):
+        layout_id = layouts[index % len(layouts)]
+        yield synthetic_invoice(layout_id, seed=index, scanned=scanned)
@@ -1,65 +1,437 @@
 # -*- coding: ascii -*-
 from __future__ import annotations
 
+import hashlib
+import io
+import json
 import os
-from dataclasses import asdict
-from decimal import Decimal
-from flask import Flask, jsonify, request
-from threading import Lock
+import time
+import zipfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, g, jsonify, request, stream_with_context
+from multiprocessing import parent_process
+from pathlib import Path
+from threading import Lock, Thread
+from werkzeug.exceptions import RequestEntityTooLarge
 
+from . import metrics
+from .cache import CacheConfig, TieredCache, fingerprint_files
+from .jobs import JOB_DONE, JOB_FAILED, JobStore, JobStoreFull
 from .ocr.engine import init_ocr
-from .pipeline import run_pipeline
+from .ocr.pool import OcrPool, OcrPoolTimeout
+from .pipeline import (
+    RESULT_VERSION,
+    PipelineOptions,
+    run_pipeline,
+    run_pipeline_stream,
+)
+from .registry import get_registry
+from .serialization import invoice_to_dict
+from .workers import OcrWorkerPool
 
 app = Flask(__name__)
 
-_OCR = None
-_OCR_INIT_LOCK = Lock()
-_OCR_LOCK = Lock()
-_OCR_LOCK_ENABLED = os.getenv("OCR_LOCK", "1").lower() not in ("0", "false", "no")
+_OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "1"))
+_OCR_POOL_TIMEOUT = float(os.getenv("OCR_POOL_TIMEOUT", "60"))
+_OCR_CPU_THREADS = int(os.getenv("OCR_CPU_THREADS", "0")) or None
+_OCR_REGION_THREADS = max(int(os.getenv("OCR_REGION_THREADS", "1")), 1)
+_OCR_POOL = OcrPool(
+    lambda: init_ocr(cpu_threads=_OCR_CPU_THREADS, cache=_OCR_CACHE),
+    max(_OCR_POOL_SIZE, _OCR_REGION_THREADS),
+)
+_OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+_OCR_WORKER_QUEUE = int(os.getenv("OCR_WORKER_QUEUE", "0")) or None
+_OCR_WORKER_TIMEOUT = float(os.getenv("OCR_WORKER_TIMEOUT", "90"))
+_OCR_CACHE_CONFIG = CacheConfig(
+    int(os.getenv("OCR_CACHE_MAX_BYTES", "0")),
+    os.getenv("OCR_CACHE_PATH", ""),
+    int(os.getenv("OCR_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))),
+)
+# Com OCR_WORKERS, cada processo de OCR cria o seu a partir da configuracao.
+_OCR_CACHE = None if _OCR_WORKERS > 0 else _OCR_CACHE_CONFIG.create()
+_BATCH_CHUNK_SIZE = max(int(os.getenv("BATCH_CHUNK_SIZE", "8")), 1)
+_BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+_BATCH_MAX_PDF_BYTES = int(os.getenv("BATCH_MAX_PDF_BYTES", str(32 * 1024 * 1024)))
+_MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+_JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0")) or max(
+    _OCR_WORKERS, _OCR_POOL_SIZE
+)
+_JOB_MAX = int(os.getenv("JOB_MAX", "1000"))
+_JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+_PIPELINE_OPTIONS = PipelineOptions(
+    ocr_mode=os.getenv("OCR_MODE", "crop").lower(),
+    text_layer=os.getenv("TEXT_LAYER", "0").lower() in ("1", "true", "yes"),
+    trim=os.getenv("TRIM_REGIONS", "0").lower() in ("1", "true", "yes"),
+    grayscale=os.getenv("OCR_GRAYSCALE", "0").lower() in ("1", "true", "yes"),
+    record_dir=os.getenv("RECORD_DIR", ""),
+)
+_SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+_RESULT_CACHE_MAX_BYTES = int(
+    os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+_RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+_RESULT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))
+)
 
 
-def _get_ocr():
-    global _OCR
-    if _OCR is None:
-        with _OCR_INIT_LOCK:
-            if _OCR is None:
-                _OCR = init_ocr()
-    return _OCR
+def _build_result_cache() -> TieredCache | None:
+    return CacheConfig(
+        _RESULT_CACHE_MAX_BYTES, _RESULT_CACHE_PATH, _RESULT_CACHE_DISK_MAX_BYTES
+    ).create()
+
+
+def _code_version() -> str:
+    # Muda a cada deploy que altere o codigo do pacote (pipeline, mappers,
+    # OCR) ou RESULT_VERSION.
+    package_dir = Path(__file__).resolve().parent
+    return f"{RESULT_VERSION}:{fingerprint_files(package_dir.rglob('*.py'))}"
+
+
+# O Werkzeug recusa com 413 corpos maiores, antes de ler o multipart.
+app.config["MAX_CONTENT_LENGTH"] = _MAX_UPLOAD_BYTES or None
+
+_RESULT_CACHE = _build_result_cache()
+_CODE_VERSION = _code_version() if _RESULT_CACHE else ""
+
+
+_WORKER_POOL = None
+_WORKER_POOL_LOCK = Lock()
+
+
+def _warm_up_worker_pool(pool: OcrWorkerPool) -> None:
+    try:
+        pool.warm_up()
+    except Exception:
+        app.logger.exception("ocr worker pool warm-up failed")
+
+
+def _get_worker_pool() -> OcrWorkerPool:
+    global _WORKER_POOL
+    if _WORKER_POOL is None:
+        with _WORKER_POOL_LOCK:
+            if _WORKER_POOL is None:
+                _WORKER_POOL = OcrWorkerPool(
+                    _OCR_WORKERS,
+                    cpu_threads=_OCR_CPU_THREADS,
+                    options=_PIPELINE_OPTIONS,
+                    max_pending=_OCR_WORKER_QUEUE,
+                    engines=_OCR_REGION_THREADS,
+                    ocr_cache=_OCR_CACHE_CONFIG,
+                )
+                # Carrega os modelos em todos os processos sem prender quem
+                # chamou; pedidos que chegam antes esperam na fila do pool.
+                Thread(
+                    target=_warm_up_worker_pool,
+                    args=(_WORKER_POOL,),
+                    name="ocr-warm-up",
+                    daemon=True,
+                ).start()
+    return _WORKER_POOL
+
+
+# Os processos de OCR sobem junto com o worker do gunicorn, e nao no primeiro
+# pedido (o app nao usa --preload, entao isto ja roda depois do fork). Um
+# processo de OCR que reimporte este modulo (python -m enel_ocr.api) nao sobe
+# outro pool.
+if _OCR_WORKERS > 0 and parent_process() is None:
+    _get_worker_pool()
+
+
+def _checkout_ocr():
+    if _OCR_REGION_THREADS > 1:
+        return _OCR_POOL.checkout_many(_OCR_REGION_THREADS, timeout=_OCR_POOL_TIMEOUT)
+    return _OCR_POOL.checkout(timeout=_OCR_POOL_TIMEOUT)
+
+
+def _discard_worker_pool(pool: OcrWorkerPool) -> None:
+    global _WORKER_POOL
+    with _WORKER_POOL_LOCK:
+        if _WORKER_POOL is pool:
+            _WORKER_POOL = None
+    pool.shutdown(wait=False)
+
+
+def _run_in_workers(method: str, argument):
+    # Um processo de OCR que morre (OOM, segfault do Paddle) quebra o executor
+    # para sempre: descarta o pool, o proximo pedido cria outro, e este
+    # responde 503 como o pool cheio. Um processo travado tambem vira 503
+    # depois de OCR_WORKER_TIMEOUT, antes do timeout do gunicorn.
+    pool = _get_worker_pool()
+    try:
+        future = getattr(pool, method)(argument, timeout=_OCR_POOL_TIMEOUT)
+        return future.result(timeout=_OCR_WORKER_TIMEOUT)
+    except BrokenProcessPool as exc:
+        app.logger.error("ocr worker pool broken, restarting it")
+        _discard_worker_pool(pool)
+        raise OcrPoolTimeout("processo de OCR caiu") from exc
+    except OcrPoolTimeout:
+        raise
+    except FutureTimeoutError as exc:
+        raise OcrPoolTimeout("OCR passou de OCR_WORKER_TIMEOUT") from exc
 
 
 def _run_pipeline(pdf_bytes: bytes):
-    ocr = _get_ocr()
-    if _OCR_LOCK_ENABLED:
-        with _OCR_LOCK:
-            return run_pipeline(pdf_bytes, ocr)
-    return run_pipeline(pdf_bytes, ocr)
+    if _OCR_WORKERS > 0:
+        return _run_in_workers("submit", pdf_bytes)
+    with _checkout_ocr() as ocr:
+        return run_pipeline(pdf_bytes, ocr, _PIPELINE_OPTIONS)
 
 
-@app.post("/invoice")
-def invoice():
+def _run_pipeline_batch(pdfs: list[bytes]):
+    if _OCR_WORKERS > 0:
+        return _run_in_workers("submit_batch", pdfs)
+    with _checkout_ocr() as ocr:
+        stream = run_pipeline_stream(
+            pdfs, ocr, _PIPELINE_OPTIONS, return_exceptions=True
+        )
+        return list(stream)
+
+
+def _cache_key(pdf_bytes: bytes) -> str:
+    # Os layouts entram pelo registro em uso, entao reload_layouts() ja muda
+    # a chave; codigo e opcoes do pipeline nao mudam sem reiniciar.
+    version = f"{_CODE_VERSION}:{get_registry().fingerprint}:{_PIPELINE_OPTIONS!r}"
+    return hashlib.sha256(version.encode("utf-8") + pdf_bytes).hexdigest()
+
+
+def _json_body(payload) -> bytes:
+    return (app.json.dumps(payload) + "\n").encode("utf-8")
+
+
+def _invoice_body(pdf_bytes: bytes) -> tuple[bytes, str | None]:
+    # Devolve o JSON do Invoice e o estado do cache (HIT, MISS ou None).
+    cache_key = None
+    if _RESULT_CACHE is not None:
+        cache_key = _cache_key(pdf_bytes)
+        with metrics.timed("stage_seconds", "cache", stage="cache"):
+            cached = _RESULT_CACHE.get(cache_key)
+        result = "miss" if cached is None else "hit"
+        metrics.increment("cache_requests_total", result=result)
+        if cached is not None:
+            return cached, "HIT"
+
+    body = _json_body(invoice_to_dict(_run_pipeline(pdf_bytes)))
+    if cache_key is None:
+        return body, None
+    _RESULT_CACHE.set(cache_key, body)
+    return body, "MISS"
+
+
+def _read_pdf_request():
     content_type = (request.content_type or "").lower()
     if "application/pdf" not in content_type:
-        return jsonify({"error": "only application/pdf is accepted"}), 400
+        return None, (jsonify({"error": "only application/pdf is accepted"}), 400)
     pdf_bytes = request.get_data()
     if not pdf_bytes:
-        return jsonify({"error": "empty body"}), 400
+        return None, (jsonify({"error": "empty body"}), 400)
     if not pdf_bytes.startswith(b"%PDF"):
-        return jsonify({"error": "invalid pdf"}), 400
+        return None, (jsonify({"error": "invalid pdf"}), 400)
+    return pdf_bytes, None
+
+
+def _run_job(pdf_bytes: bytes) -> bytes:
+    try:
+        with metrics.tracked("in_flight", endpoint="jobs"):
+            return _invoice_body(pdf_bytes)[0]
+    except OcrPoolTimeout:
+        raise
+    except Exception:
+        app.logger.exception("invoice job failed")
+        raise
+
+
+_JOB_STORE = JobStore(_run_job, _JOB_WORKERS, _JOB_MAX, _JOB_TTL)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.endpoint or "unknown"
+    started = g.get("request_started")
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        metrics.observe("request_seconds", elapsed, endpoint=endpoint)
+    metrics.increment(
+        "requests_total", endpoint=endpoint, status=str(response.status_code)
+    )
+    return response
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def _request_too_large(_error):
+    return jsonify({"error": "request too large"}), 413
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return app.response_class(
+        metrics.render_metrics(), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.post("/invoice")
+def invoice():
+    pdf_bytes, error = _read_pdf_request()
+    if error is not None:
+        return error
+
+    with metrics.collect_timings() as timings, metrics.tracked(
+        "in_flight", endpoint="invoice"
+    ):
+        try:
+            body, cache_status = _invoice_body(pdf_bytes)
+        except OcrPoolTimeout:
+            return jsonify({"error": "ocr busy, try again later"}), 503
+
+    response = app.response_class(body, mimetype="application/json")
+    if cache_status is not None:
+        response.headers["X-Cache"] = cache_status
+    if _SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return response
+
+
+@app.post("/jobs")
+def create_job():
+    pdf_bytes, error = _read_pdf_request()
+    if error is not None:
+        return error
+
+    try:
+        job = _JOB_STORE.submit(pdf_bytes)
+    except JobStoreFull:
+        return jsonify({"error": "job queue full, try again later"}), 503
+
+    response = jsonify({"id": job.id, "status": job.status})
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id: str):
+    job = _JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    if job.status == JOB_DONE:
+        return app.response_class(job.result, mimetype="application/json")
+    if job.status == JOB_FAILED:
+        if isinstance(job.error, OcrPoolTimeout):
+            error, status_code = "ocr busy, try again later", 503
+        else:
+            error, status_code = "processing failed", 500
+        payload = {"id": job.id, "status": job.status, "error": error}
+        return jsonify(payload), status_code
+    return jsonify({"id": job.id, "status": job.status}), 202
+
+
+@app.post("/invoices/batch")
+def invoices_batch():
+    content_type = (request.content_type or "").lower()
+    if "multipart/form-data" in content_type:
+        files = [
+            (storage.filename or name, storage.read())
+            for name, storage in request.files.items(multi=True)
+        ]
+        if any(len(pdf_bytes) > _BATCH_MAX_PDF_BYTES for _name, pdf_bytes in files):
+            raise RequestEntityTooLarge()
+    elif "application/zip" in content_type:
+        try:
+            files = _zip_pdfs(request.get_data())
+        except zipfile.BadZipFile:
+            return jsonify({"error": "invalid zip"}), 400
+    else:
+        return jsonify(
+            {"error": "only multipart/form-data or application/zip is accepted"}
+        ), 400
+    if not files:
+        return jsonify({"error": "no pdf files"}), 400
+    if len(files) > _BATCH_MAX_FILES:
+        return jsonify({"error": f"at most {_BATCH_MAX_FILES} files per batch"}), 400
+
+    def generate():
+        for start in range(0, len(files), _BATCH_CHUNK_SIZE):
+            chunk = files[start : start + _BATCH_CHUNK_SIZE]
+            entries = _process_batch_chunk([pdf_bytes for _name, pdf_bytes in chunk])
+            for (filename, _pdf_bytes), entry in zip(chunk, entries):
+                yield app.json.dumps({"filename": filename, **entry}) + "\n"
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+
+
+def _zip_pdfs(data: bytes) -> list[tuple[str, bytes]]:
+    # Confere o tamanho descompactado de cada PDF e a soma antes de extrair
+    # (o zipfile nao le alem do tamanho declarado): um zip pequeno nao pode
+    # ocupar a memoria do worker.
+    files = []
+    total = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            total += info.file_size
+            if info.file_size > _BATCH_MAX_PDF_BYTES or total > _MAX_UPLOAD_BYTES:
+                raise RequestEntityTooLarge()
+            files.append((info.filename, archive.read(info)))
+    return files
+
 
-    invoice_obj = _run_pipeline(pdf_bytes)
+def _process_batch_chunk(pdfs: list[bytes]) -> list[dict]:
+    entries: list[dict | None] = [None] * len(pdfs)
+    cache_keys: list[str | None] = [None] * len(pdfs)
+    todo = []
+    for index, pdf_bytes in enumerate(pdfs):
+        if not pdf_bytes or not pdf_bytes.startswith(b"%PDF"):
+            entries[index] = {"status": 400, "error": "invalid pdf"}
+            continue
+        if _RESULT_CACHE is not None:
+            cache_keys[index] = _cache_key(pdf_bytes)
+            cached = _RESULT_CACHE.get(cache_keys[index])
+            result = "miss" if cached is None else "hit"
+            metrics.increment("cache_requests_total", result=result)
+            if cached is not None:
+                entries[index] = {"status": 200, "result": json.loads(cached)}
+                continue
+        todo.append(index)
 
-    payload = asdict(invoice_obj)
-    return jsonify(_serialize_decimals(payload))
+    if todo:
+        try:
+            with metrics.tracked("in_flight", endpoint="batch"):
+                invoices = _run_pipeline_batch([pdfs[index] for index in todo])
+        except OcrPoolTimeout:
+            invoices = [None] * len(todo)
+        except Exception:
+            # Falha do lote inteiro (ex.: processo de OCR morto): refaz um a um.
+            invoices = [_run_single(pdfs[index]) for index in todo]
+        for index, invoice_obj in zip(todo, invoices):
+            if invoice_obj is None:
+                entries[index] = {"status": 503, "error": "ocr busy, try again later"}
+            elif isinstance(invoice_obj, Exception):
+                app.logger.error("batch invoice failed", exc_info=invoice_obj)
+                entries[index] = {"status": 500, "error": "processing failed"}
+            else:
+                payload = invoice_to_dict(invoice_obj)
+                if cache_keys[index] is not None:
+                    _RESULT_CACHE.set(cache_keys[index], _json_body(payload))
+                entries[index] = {"status": 200, "result": payload}
+    return entries
 
 
-def _serialize_decimals(value):
-    if isinstance(value, Decimal):
-        return str(value)
-    if isinstance(value, list):
-        return [_serialize_decimals(item) for item in value]
-    if isinstance(value, dict):
-        return {key: _serialize_decimals(item) for key, item in value.items()}
-    return value
+def _run_single(pdf_bytes: bytes):
+    try:
+        return _run_pipeline(pdf_bytes)
+    except OcrPoolTimeout:
+        return None
+    except Exception as exc:
+        return exc
 
 
 if __name__ == "__main__":
@@ -0,0 +1,286 @@
+# -*- coding: ascii -*-
+"""
+Processamento em massa de PDFs fora da API:
+
+    python -m enel_ocr.batch faturas/ -o resultados.jsonl
+
+Cada linha da saida traz path, sha256 e status (200 com result, 500 com
+error). Ao rodar de novo com a mesma saida, os PDFs cujo hash ja tem
+resultado sao pulados; falhas sao tentadas de novo.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Tuple
+
+from .cache import CacheConfig
+from .serialization import invoice_to_dict
+from .workers import OcrWorkerPool
+
+if TYPE_CHECKING:
+    from .pipeline import PipelineOptions
+
+# (path, sha256, bytes do PDF)
+PdfFile = Tuple[Path, str, bytes]
+
+
+def collect_paths(inputs: Iterable[str]) -> List[Path]:
+    """Diretorios (recursivo), PDFs avulsos ou manifestos com um caminho por linha."""
+    paths: list[Path] = []
+    for raw in inputs:
+        path = Path(raw)
+        if path.is_dir():
+            found = (item for item in path.rglob("*") if item.suffix.lower() == ".pdf")
+            paths.extend(sorted(found))
+        elif path.suffix.lower() == ".pdf":
+            paths.append(path)
+        else:
+            for line in path.read_text(encoding="utf-8").splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(path.parent / line)
+    return paths
+
+
+def processed_hashes(output: Path) -> set[str]:
+    done: set[str] = set()
+    if not output.exists():
+        return done
+    with output.open(encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Ultima linha truncada por uma execucao interrompida.
+                continue
+            if entry.get("status") == 200:
+                done.add(entry["sha256"])
+    return done
+
+
+def _pending_files(
+    paths: Iterable[Path], done: set[str], unreadable: list[Path]
+) -> Iterator[PdfFile]:
+    seen = set(done)
+    for path in paths:
+        try:
+            pdf_bytes = path.read_bytes()
+        except OSError as exc:
+            print(f"{path}: {exc}", file=sys.stderr)
+            unreadable.append(path)
+            continue
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        yield path, digest, pdf_bytes
+
+
+def _chunks(files: Iterator[PdfFile], size: int) -> Iterator[List[PdfFile]]:
+    chunk: list[PdfFile] = []
+    for item in files:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _WorkerPools:
+    """
+    OcrWorkerPool recriado quando um processo de OCR morre: o executor com
+    BrokenProcessPool recusa tudo dali em diante e o batch precisa seguir.
+    """
+
+    def __init__(self, factory: Callable[[], OcrWorkerPool]) -> None:
+        self._factory = factory
+        self.pool = factory()
+
+    def restart(self, broken: OcrWorkerPool) -> None:
+        if self.pool is not broken:
+            return
+        print("processo de OCR caiu; recriando os processos", file=sys.stderr)
+        broken.shutdown(wait=False)
+        self.pool = self._factory()
+
+    def submit_batch(self, pdfs: list[bytes]) -> Tuple[OcrWorkerPool, Future]:
+        pool = self.pool
+        try:
+            return pool, pool.submit_batch(pdfs)
+        except BrokenProcessPool:
+            self.restart(pool)
+            return self.pool, self.pool.submit_batch(pdfs)
+
+    def run_single(self, pdf_bytes: bytes):
+        pool = self.pool
+        try:
+            return pool.submit(pdf_bytes).result()
+        except BrokenProcessPool as exc:
+            self.restart(pool)
+            return exc
+        except Exception as exc:
+            return exc
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
+
+
+def _entries(
+    pools: _WorkerPools, pool: OcrWorkerPool, chunk: List[PdfFile], future: Future
+) -> list[dict]:
+    try:
+        invoices = future.result()
+    except Exception as exc:
+        if isinstance(exc, BrokenProcessPool):
+            pools.restart(pool)
+        # Isola o PDF que falhou (ou derrubou o processo) um a um; os demais
+        # lotes em andamento no pool quebrado caem aqui e sao refeitos.
+        invoices = [pools.run_single(item[2]) for item in chunk]
+    entries = []
+    for (path, digest, _pdf_bytes), invoice in zip(chunk, invoices):
+        entry = {"path": str(path), "sha256": digest}
+        if isinstance(invoice, Exception):
+            entry.update(status=500, error=f"{type(invoice).__name__}: {invoice}")
+        else:
+            entry.update(status=200, result=invoice_to_dict(invoice))
+        entries.append(entry)
+    return entries
+
+
+def run_batch(
+    paths: List[Path],
+    output: Path,
+    workers: int,
+    cpu_threads: int | None = None,
+    options: PipelineOptions | None = None,
+    chunk_size: int = 4,
+    ocr_cache: CacheConfig | None = None,
+) -> dict[str, int]:
+    done = processed_hashes(output)
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    pools = _WorkerPools(
+        lambda: OcrWorkerPool(
+            workers, cpu_threads=cpu_threads, options=options, ocr_cache=ocr_cache
+        )
+    )
+    in_flight: dict[Future, Tuple[OcrWorkerPool, List[PdfFile]]] = {}
+    unreadable: list[Path] = []
+
+    def drain(return_when) -> None:
+        finished, _pending = wait(in_flight, return_when=return_when)
+        for future in finished:
+            pool, chunk = in_flight.pop(future)
+            for entry in _entries(pools, pool, chunk, future):
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                counts["ok" if entry["status"] == 200 else "failed"] += 1
+        handle.flush()
+
+    try:
+        with output.open("a+", encoding="utf-8") as handle:
+            handle.seek(0, os.SEEK_END)
+            if handle.tell() > 0:
+                handle.seek(handle.tell() - 1)
+                if handle.read(1) != "\n":
+                    handle.write("\n")
+            for chunk in _chunks(_pending_files(paths, done, unreadable), chunk_size):
+                if len(in_flight) >= workers * 2:
+                    drain(FIRST_COMPLETED)
+                pool, future = pools.submit_batch([item[2] for item in chunk])
+                in_flight[future] = (pool, chunk)
+            if in_flight:
+                drain(ALL_COMPLETED)
+    finally:
+        pools.shutdown()
+    counts["failed"] += len(unreadable)
+    counts["skipped"] = len(paths) - counts["ok"] - counts["failed"]
+    return counts
+
+
+def main(argv: List[str] | None = None) -> int:
+    # Os processos de OCR reimportam este modulo: o pipeline (numpy, fitz) so
+    # entra aqui, para nao carregar antes de fixarem os limites de threads.
+    from .pipeline import OCR_MODES, PipelineOptions
+
+    parser = argparse.ArgumentParser(
+        prog="python -m enel_ocr.batch",
+        description="Processa PDFs de faturas em paralelo e grava JSON Lines.",
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="diretorios, arquivos .pdf ou manifestos (.txt)"
+    )
+    parser.add_argument("-o", "--output", required=True, help="arquivo .jsonl de saida")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processos de OCR, cada um com sua engine (padrao: CPUs)",
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=1,
+        help="threads de CPU por engine (padrao: 1)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=4,
+        help="PDFs por lote de OCR em cada processo (padrao: 4)",
+    )
+    parser.add_argument("--ocr-mode", choices=OCR_MODES, default="crop")
+    parser.add_argument("--text-layer", action="store_true")
+    parser.add_argument("--trim", action="store_true")
+    parser.add_argument("--grayscale", action="store_true")
+    parser.add_argument(
+        "--record-dir",
+        default="",
+        help="grava o OCR de cada fatura como fixture para replay dos mappers",
+    )
+    parser.add_argument(
+        "--ocr-cache-mb",
+        type=int,
+        default=0,
+        help="cache em memoria da saida do OCR por processo, em MiB (padrao: 0)",
+    )
+    parser.add_argument(
+        "--ocr-cache-path",
+        default="",
+        help="arquivo SQLite do cache do OCR, compartilhado entre os processos",
+    )
+    args = parser.parse_args(argv)
+
+    paths = collect_paths(args.inputs)
+    counts = run_batch(
+        paths,
+        Path(args.output),
+        workers=max(args.workers, 1),
+        cpu_threads=args.cpu_threads or None,
+        options=PipelineOptions(
+            ocr_mode=args.ocr_mode,
+            text_layer=args.text_layer,
+            trim=args.trim,
+            grayscale=args.grayscale,
+            record_dir=args.record_dir,
+        ),
+        chunk_size=max(args.chunk_size, 1),
+        ocr_cache=CacheConfig(args.ocr_cache_mb * 1024 * 1024, args.ocr_cache_path),
+    )
+    print(
+        f"{len(paths)} PDFs: {counts['ok']} ok, {counts['failed']} com falha, "
+        f"{counts['skipped']} ja processados",
+        file=sys.stderr,
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
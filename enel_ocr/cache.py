@@ -0,0 +1,205 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+
+
+class LruCache:
+    """Cache em memoria de valores bytes, limitado pelo total de bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[tuple[str, bytes]]) -> None:
+        with self._lock:
+            for key, value in items:
+                if len(value) > self._max_bytes:
+                    continue
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._size -= len(previous)
+                self._entries[key] = value
+                self._size += len(value)
+                while self._size > self._max_bytes:
+                    _key, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+
+
+# Um acerto so regrava o horario de acesso se o anterior for mais velho que
+# isso: a ordem de remocao fica aproximada e get quase nunca escreve.
+ACCESS_RESOLUTION = 60.0
+# Entradas lidas por consulta ao remover as acessadas ha mais tempo.
+EVICT_BATCH = 64
+
+
+class SqliteCache:
+    """
+    Cache em disco compartilhado entre processos (ex.: workers do gunicorn).
+    Ao passar de max_bytes, remove as entradas acessadas ha mais tempo. O
+    total de bytes fica numa linha de meta, atualizada a cada escrita.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta "
+                "(name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            # Arquivos de antes da tabela meta: o total e somado uma vez.
+            self._conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) "
+                "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+            )
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, accessed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > ACCESS_RESOLUTION:
+                self._conn.execute(
+                    "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+                )
+            return bytes(row[0])
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[tuple[str, bytes]]) -> None:
+        """Grava todas as entradas numa transacao so (um commit)."""
+        items = [(key, value) for key, value in items if len(value) <= self._max_bytes]
+        if not items:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            # Trava de escrita desde o inicio: o total lido e o que sera gravado.
+            self._conn.execute("BEGIN IMMEDIATE")
+            for key, value in items:
+                self._insert(key, value, now)
+            self._evict()
+
+    def _insert(self, key: str, value: bytes, now: float) -> None:
+        previous = self._conn.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            (key, value, len(value), now),
+        )
+        self._conn.execute(
+            "UPDATE meta SET value = value + ? WHERE name = 'total_bytes'",
+            (len(value) - (previous[0] if previous else 0),),
+        )
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT value FROM meta WHERE name = 'total_bytes'"
+        ).fetchone()
+        while total > self._max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT ?",
+                (EVICT_BATCH,),
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            freed = 0
+            for old_key, size in rows:
+                if total - freed <= self._max_bytes:
+                    break
+                evicted.append((old_key,))
+                freed += size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            self._conn.execute(
+                "UPDATE meta SET value = value - ? WHERE name = 'total_bytes'",
+                (freed,),
+            )
+            total -= freed
+
+
+class TieredCache:
+    """Memoria na frente de um cache em disco opcional."""
+
+    def __init__(self, memory: LruCache, disk: SqliteCache | None = None) -> None:
+        self._memory = memory
+        self._disk = disk
+
+    def get(self, key: str) -> bytes | None:
+        value = self._memory.get(key)
+        if value is not None or self._disk is None:
+            return value
+        value = self._disk.get(key)
+        if value is not None:
+            self._memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[tuple[str, bytes]]) -> None:
+        items = list(items)
+        self._memory.set_many(items)
+        if self._disk is not None:
+            self._disk.set_many(items)
+
+
+@dataclass(frozen=True)
+class CacheConfig:
+    """
+    Limites de um TieredCache. Vai por pickle para os processos de OCR, que
+    criam cada um o seu; o arquivo SQLite em path e compartilhado entre eles.
+    """
+
+    max_bytes: int = 0
+    path: str = ""
+    disk_max_bytes: int = 1024 * 1024 * 1024
+
+    def create(self) -> TieredCache | None:
+        if self.max_bytes <= 0 and not self.path:
+            return None
+        disk = SqliteCache(self.path, self.disk_max_bytes) if self.path else None
+        return TieredCache(LruCache(max(self.max_bytes, 0)), disk)
+
+
+def fingerprint_files(paths: Iterable[Path]) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
@@ -1,10 +1,7 @@
 # -*- coding: ascii -*-
-from dataclasses import dataclass
-import json
-from pathlib import Path
-
+from __future__ import annotations
 
-_LAYOUTS_DIR = Path(__file__).resolve().parent / "layouts"
+from dataclasses import dataclass
 
 
 @dataclass(frozen=True)
@@ -14,21 +11,18 @@ class Coordinates:
     y: int
     width: int
     height: int
+    single_line: bool = False
+    dpi: int | None = None
+    page: int = 1
+
+
+def layout_ids() -> list[str]:
+    from .registry import get_registry
+
+    return list(get_registry().layouts)
 
 
 def build_regions(layout_id: str = "v1") -> list[Coordinates]:
-    layout_path = _LAYOUTS_DIR / f"{layout_id}.json"
-    with layout_path.open("r", encoding="utf-8") as handle:
-        payload = json.load(handle)
-
-    regions = payload.get("regions", [])
-    return [
-        Coordinates(
-            description=region["description"],
-            x=region["x"],
-            y=region["y"],
-            width=region["width"],
-            height=region["height"],
-        )
-        for region in regions
-    ]
+    from .registry import get_registry
+
+    return list(get_registry().regions(layout_id))
@@ -1,61 +1,79 @@
 # -*- coding: ascii -*-
 from __future__ import annotations
 
-import json
-import unicodedata
-from pathlib import Path
-
-from .ocr.crop import ImageCropper
-from .ocr.engine import run_ocr
-
-_HEADERS_PATH = Path(__file__).resolve().parent / "layouts" / "headers.json"
-
-
-def _normalize_text(text: str) -> str:
-    normalized = unicodedata.normalize("NFKD", text)
-    without_accents = "".join(
-        char for char in normalized if not unicodedata.combining(char)
-    )
-    return " ".join(without_accents.upper().split())
-
-
-def _parse_region(region: dict) -> tuple[int, int, int, int] | None:
-    try:
-        x = int(float(region["x"]))
-        y = int(float(region["y"]))
-        w = int(float(region["w"]))
-        h = int(float(region["h"]))
-    except (KeyError, TypeError, ValueError):
-        return None
-
-    if w <= 0 or h <= 0:
+from difflib import SequenceMatcher
+from typing import Mapping, Sequence, Tuple
+
+from .registry import get_registry, normalize_text
+
+
+# Score de uma ancora achada exatamente no texto; abaixo de MIN_SCORE o
+# cabecalho nao conta e a fatura cai no layout de fallback.
+CONFIDENT_SCORE = 1.0
+MIN_SCORE = 0.8
+
+Rect = Tuple[int, int, int, int]
+
+
+def detection_regions() -> list[tuple[Rect, bool]]:
+    """
+    Recortes de cabecalho dos layouts, na ordem de headers.json e sem repetir
+    os iguais, e se cada um e de uma linha so (single_line).
+    """
+    regions: dict[Rect, bool] = {}
+    for rule in get_registry().headers:
+        if rule.region and rule.anchors:
+            single_line = regions.get(rule.region, True) and rule.single_line
+            regions[rule.region] = single_line
+    return list(regions.items())
+
+
+def anchor_score(anchors: Sequence[str], texts: Sequence[str]) -> float:
+    """
+    Maior semelhanca entre uma ancora (ja normalizada) e um trecho do texto
+    do mesmo tamanho: 1.0 quando aparece exatamente, menos quando o OCR
+    trocou ou perdeu caracteres.
+    """
+    haystack = normalize_text(" ".join(texts))
+    best = 0.0
+    for anchor in anchors:
+        if anchor in haystack:
+            return 1.0
+        size = len(anchor)
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(anchor)
+        for start in range(max(len(haystack) - size, 0) + 1):
+            matcher.set_seq1(haystack[start : start + size])
+            if matcher.real_quick_ratio() <= best or matcher.quick_ratio() <= best:
+                continue
+            best = max(best, matcher.ratio())
+    return best
+
+
+def choose_layout(
+    texts: Mapping[Rect, Sequence[str]], final: bool = True
+) -> str | None:
+    """
+    Pontua os layouts de headers.json, na ordem do arquivo, pelo texto ja
+    lido do recorte de cada um. Para no primeiro com score confiante; sem
+    ele, escolhe o maior score a partir de MIN_SCORE ou o layout de
+    fallback. Com final=False devolve None em vez de decidir sem um score
+    confiante (ainda ha recortes a ler).
+    """
+    registry = get_registry()
+    best_id = None
+    best = 0.0
+    for rule in registry.headers:
+        if not rule.region or not rule.anchors or rule.region not in texts:
+            continue
+        score = anchor_score(rule.anchors, texts[rule.region])
+        if score >= CONFIDENT_SCORE:
+            return rule.layout_id
+        if score > best:
+            best_id, best = rule.layout_id, score
+    if not final:
         return None
+    if best_id is not None and best >= MIN_SCORE:
+        return best_id
+    return registry.fallback_layout
 
-    return (x, y, w, h)
-
-
-def detect_layout(ocr, cropper: ImageCropper) -> str:
-    if not _HEADERS_PATH.exists():
-        return "v1"
-
-    with _HEADERS_PATH.open("r", encoding="utf-8") as handle:
-        payload = json.load(handle)
-
-    v1_rules = payload.get("v1", {})
-    anchors = [_normalize_text(str(anchor)) for anchor in v1_rules.get("anchors", [])]
-    region = v1_rules.get("region", {})
-    coords = _parse_region(region)
-    if not coords or not anchors:
-        return "v1"
-
-    image_np = cropper.crop_ndarray(coords)
-    texts, _boxes, _scores = run_ocr(ocr, image_np)
-    haystack = _normalize_text(" ".join(texts))
-
-    if any(anchor in haystack for anchor in anchors):
-        return "v1"
-
-    if "v2" in payload:
-        return "v2"
-
-    return "v1"
@@ -0,0 +1,89 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobStoreFull(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    status: str
+    created_at: float
+    finished_at: float | None = None
+    result: bytes | None = None
+    error: Exception | None = None
+
+
+class JobStore:
+    """
+    Jobs em memoria executados por um numero fixo de threads. Guarda no
+    maximo max_jobs jobs; os concluidos ficam disponiveis por ttl segundos e,
+    com o limite atingido, os concluidos mais antigos dao lugar aos novos.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[bytes], bytes],
+        workers: int,
+        max_jobs: int,
+        ttl: float,
+    ) -> None:
+        self._runner = runner
+        self._max_jobs = max_jobs
+        self._ttl = ttl
+        self._jobs: dict[str, Job] = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ocr-job"
+        )
+
+    def submit(self, pdf_bytes: bytes) -> Job:
+        with self._lock:
+            self._prune(time.time())
+            if len(self._jobs) >= self._max_jobs:
+                raise JobStoreFull("fila de jobs cheia")
+            job = Job(id=uuid.uuid4().hex, status=JOB_QUEUED, created_at=time.time())
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, pdf_bytes)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._prune(time.time())
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, pdf_bytes: bytes) -> None:
+        job.status = JOB_RUNNING
+        try:
+            job.result = self._runner(pdf_bytes)
+            job.status = JOB_DONE
+        except Exception as exc:
+            job.error = exc
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self, now: float) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at,
+        )
+        for job in finished:
+            expired = now - job.finished_at > self._ttl
+            if not expired and len(self._jobs) < self._max_jobs:
+                break
+            del self._jobs[job.id]
@@ -2,9 +2,12 @@
 from __future__ import annotations
 
 from decimal import Decimal, InvalidOperation
+from itertools import chain
 import re
 import unicodedata
 
+import numpy as np
+
 
 def normalize_text(value: str, case: str = "lower") -> str:
     normalized = unicodedata.normalize("NFKD", value)
@@ -50,54 +53,135 @@ def normalize_box_points(box) -> list[tuple[float, float]] | None:
     return None
 
 
-def build_items(texts: list, boxes: list) -> list[dict]:
-    items = []
-    for index, (text, box) in enumerate(zip(texts, boxes)):
-        if not text or not box:
-            continue
+class OcrItem:
+    """Caixa de texto do OCR com as posicoes usadas pelos mappers de tabela."""
+
+    __slots__ = ("index", "text", "x", "x_center", "y_center", "height")
+
+    def __init__(
+        self,
+        index: int,
+        text: str,
+        x: float,
+        x_center: float,
+        y_center: float,
+        height: float,
+    ) -> None:
+        self.index = index
+        self.text = text
+        self.x = x
+        self.x_center = x_center
+        self.y_center = y_center
+        self.height = height
+
+
+def _box_bounds(boxes: list) -> np.ndarray | None:
+    # (x_min, x_max, y_min, y_max) por caixa, de uma vez so quando todas as
+    # caixas tem os mesmos pontos (x, y), como na saida do OCR. fromiter
+    # sobre a lista achatada sai mais barato que np.asarray da lista aninhada.
+    corners = len(boxes[0])
+    if not corners or any(len(box) != corners for box in boxes):
+        return None
+    try:
+        flat = np.fromiter(chain.from_iterable(chain.from_iterable(boxes)), float)
+    except (TypeError, ValueError):
+        return None
+    if flat.size != len(boxes) * corners * 2:
+        return None
+    points = flat.reshape(len(boxes), corners, 2)
+    xs = points[:, :, 0]
+    ys = points[:, :, 1]
+    return np.stack([xs.min(axis=1), xs.max(axis=1), ys.min(axis=1), ys.max(axis=1)])
+
+
+class OcrItems:
+    """
+    Caixas de texto de uma regiao, calculadas uma vez: coordenadas em arrays
+    NumPy e um OcrItem por caixa. rows() agrupa as caixas em linhas e guarda o
+    resultado, entao mappers que leem a mesma regiao (itens da fatura e
+    medidores) dividem o trabalho; eles so leem items e rows, nao alteram.
+    """
+
+    __slots__ = ("items", "x", "x_center", "y_center", "height", "_rows")
+
+    def __init__(self, texts: list, boxes: list) -> None:
+        indices = []
+        kept_boxes = []
+        for index, (text, box) in enumerate(zip(texts, boxes)):
+            if not text or box is None or len(box) == 0:
+                continue
+            indices.append(index)
+            kept_boxes.append(box)
+        bounds = _box_bounds(kept_boxes) if kept_boxes else None
+        if bounds is None:
+            indices, bounds = _box_bounds_slow(indices, kept_boxes)
+        x_min, x_max, y_min, y_max = bounds
+        self.x = x_min
+        self.x_center = (x_min + x_max) / 2
+        self.y_center = (y_min + y_max) / 2
+        self.height = y_max - y_min
+        self.items = [
+            OcrItem(index, texts[index], x, x_center, y_center, height)
+            for index, x, x_center, y_center, height in zip(
+                indices,
+                self.x.tolist(),
+                self.x_center.tolist(),
+                self.y_center.tolist(),
+                self.height.tolist(),
+            )
+        ]
+        self._rows: list[list[OcrItem]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def rows(self) -> list[list[OcrItem]]:
+        """Caixas agrupadas em linhas, cada uma ordenada da esquerda para a direita."""
+        if self._rows is None:
+            self._rows = self._group_rows()
+        return self._rows
+
+    def _group_rows(self) -> list[list[OcrItem]]:
+        if not self.items:
+            return []
+        limit = max(8, median(self.height[self.height > 0].tolist()) * 0.6)
+        order = np.argsort(self.y_center, kind="stable").tolist()
+        y_centers = self.y_center.tolist()
+        rows: list[list[int]] = []
+        current = 0.0
+        for position in order:
+            y_center = y_centers[position]
+            if rows and abs(y_center - current) <= limit:
+                row = rows[-1]
+                row.append(position)
+                # Media dos centros da linha ate aqui.
+                current = ((current * (len(row) - 1)) + y_center) / len(row)
+            else:
+                rows.append([position])
+                current = y_center
+        xs = self.x.tolist()
+        items = self.items
+        return [
+            [items[position] for position in sorted(row, key=xs.__getitem__)]
+            for row in rows
+        ]
+
+
+def _box_bounds_slow(
+    indices: list[int], boxes: list
+) -> tuple[list[int], np.ndarray]:
+    # Caixas em formatos mistos (pontos, x0/y0/x1/y1 ou 8 numeros).
+    kept = []
+    bounds = []
+    for index, box in zip(indices, boxes):
         points = normalize_box_points(box)
         if not points:
             continue
         xs = [point[0] for point in points]
         ys = [point[1] for point in points]
-        x_min = min(xs)
-        x_max = max(xs)
-        y_min = min(ys)
-        y_max = max(ys)
-        items.append(
-            {
-                "index": index,
-                "text": text,
-                "x": x_min,
-                "x_center": (x_min + x_max) / 2,
-                "y_center": (y_min + y_max) / 2,
-                "height": y_max - y_min,
-            }
-        )
-    return items
-
-
-def group_items_by_row(items: list[dict]) -> list[list[dict]]:
-    if not items:
-        return []
-    heights = [item["height"] for item in items if item["height"] > 0]
-    limit = max(8, median(heights) * 0.6)
-    items_sorted = sorted(items, key=lambda item: item["y_center"])
-    rows: list[dict] = []
-    for item in items_sorted:
-        if not rows:
-            rows.append({"y_center": item["y_center"], "items": [item]})
-            continue
-        current = rows[-1]
-        if abs(item["y_center"] - current["y_center"]) <= limit:
-            current["items"].append(item)
-            total = len(current["items"])
-            current["y_center"] = (
-                (current["y_center"] * (total - 1)) + item["y_center"]
-            ) / total
-        else:
-            rows.append({"y_center": item["y_center"], "items": [item]})
-    return [sorted(row["items"], key=lambda item: item["x"]) for row in rows]
+        kept.append(index)
+        bounds.append((min(xs), max(xs), min(ys), max(ys)))
+    return kept, np.array(bounds, dtype=np.float64).reshape(-1, 4).T
 
 
 def parse_decimal(value: str) -> Decimal:
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from ..models import InvoiceItem
-from ._utils import build_items, group_items_by_row, normalize_text, parse_decimal
+from ._utils import OcrItem, OcrItems, normalize_text, parse_decimal
 
 COLUMN_ORDER = [
     "description",
@@ -46,8 +46,8 @@ HEADER_KEYWORDS = {
 }
 
 
-def _row_like_header(row: list[dict]) -> bool:
-    row_text = " ".join(item["text"] for item in row)
+def _row_like_header(row: list[OcrItem]) -> bool:
+    row_text = " ".join(item.text for item in row)
     normalized = normalize_text(row_text)
     matches = [key for key in HEADER_KEYWORDS if key in normalized]
     has_description = any(
@@ -56,46 +56,45 @@ def _row_like_header(row: list[dict]) -> bool:
     return len(matches) >= 3 and has_description
 
 
-def _row_extends_header(row: list[dict]) -> bool:
-    row_text = " ".join(item["text"] for item in row)
+def _row_extends_header(row: list[OcrItem]) -> bool:
+    row_text = " ".join(item.text for item in row)
     normalized = normalize_text(row_text)
     if any(char.isdigit() for char in normalized):
         return False
     return any(key in normalized for key in HEADER_KEYWORDS)
 
 
-def _find_header_index(rows: list[list[dict]]) -> int | None:
+def _find_header_index(rows: list[list[OcrItem]]) -> int | None:
     for index, row in enumerate(rows):
         if _row_like_header(row):
             return index
     return None
 
 
-def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
+def _infer_column_positions(header_items: list[OcrItem]) -> dict[str, float]:
     positions: dict[str, float] = {}
     used = set()
     for column, keywords in HEADER_COLUMNS:
         for item in header_items:
-            if item["index"] in used:
+            if item.index in used:
                 continue
-            text = normalize_text(item["text"])
+            text = normalize_text(item.text)
             if any(keyword in text for keyword in keywords):
                 if column == "description":
                     matched = [
                         candidate
                         for candidate in header_items
                         if any(
-                            keyword in normalize_text(candidate["text"])
+                            keyword in normalize_text(candidate.text)
                             for keyword in keywords
                         )
                     ]
                     positions[column] = max(
-                        candidate.get("x_center", candidate["x"])
-                        for candidate in matched
+                        candidate.x_center for candidate in matched
                     )
                 else:
-                    positions[column] = item.get("x_center", item["x"])
-                used.add(item["index"])
+                    positions[column] = item.x_center
+                used.add(item.index)
                 break
     if "amount" not in positions:
         unit_price = positions.get("unit_price_with_taxes")
@@ -106,7 +105,7 @@ def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
 
 
 def _assign_line_items(
-    items: list[dict],
+    items: list[OcrItem],
     column_positions: dict[str, float],
 ) -> dict[str, str]:
     row = {column: "" for column in COLUMN_ORDER}
@@ -119,7 +118,7 @@ def _assign_line_items(
             (sorted_positions[index][1] + sorted_positions[index + 1][1]) / 2
         )
     for item in items:
-        x_value = item["x_center"]
+        x_value = item.x_center
         column_index = 0
         for boundary in boundaries:
             if x_value < boundary:
@@ -129,9 +128,9 @@ def _assign_line_items(
             min(column_index, len(sorted_positions) - 1)
         ][0]
         if row[column_name]:
-            row[column_name] = f"{row[column_name]} {item['text']}".strip()
+            row[column_name] = f"{row[column_name]} {item.text}".strip()
         else:
-            row[column_name] = item["text"]
+            row[column_name] = item.text
     return row
 
 
@@ -142,10 +141,10 @@ def _is_numeric_text(value: str) -> bool:
     return all(char in allowed for char in value.strip())
 
 
-def _is_numeric_row(items: list[dict]) -> bool:
+def _is_numeric_row(items: list[OcrItem]) -> bool:
     if not items:
         return False
-    return all(_is_numeric_text(item["text"]) for item in items)
+    return all(_is_numeric_text(item.text) for item in items)
 
 
 def _description_limit(column_positions: dict[str, float]) -> float | None:
@@ -157,20 +156,23 @@ def _description_limit(column_positions: dict[str, float]) -> float | None:
     return None
 
 
-def _is_description_code_row(items: list[dict], limit: float | None) -> bool:
+def _is_description_code_row(items: list[OcrItem], limit: float | None) -> bool:
     if limit is None or not items:
         return False
-    if not all(item["x"] < limit for item in items):
+    if not all(item.x < limit for item in items):
         return False
-    combined = "".join(item["text"].strip() for item in items)
+    combined = "".join(item.text.strip() for item in items)
     if not combined:
         return False
     return combined.isdigit() and len(combined) <= 6
 
 
 def map(texts: list, boxes: list) -> list[InvoiceItem]:
-    items = build_items(texts, boxes)
-    rows = group_items_by_row(items)
+    return map_items(OcrItems(texts, boxes))
+
+
+def map_items(items: OcrItems) -> list[InvoiceItem]:
+    rows = items.rows()
     header_index = _find_header_index(rows)
     if header_index is None:
         return []
@@ -189,7 +191,7 @@ def map(texts: list, boxes: list) -> list[InvoiceItem]:
     for row in rows[header_index + 1 :]:
         if _is_description_code_row(row, description_limit) and result_rows:
             result_rows[-1]["description"] = (
-                f"{result_rows[-1]['description']} {' '.join(item['text'] for item in row)}"
+                f"{result_rows[-1]['description']} {' '.join(item.text for item in row)}"
             ).strip()
             continue
         if _is_numeric_row(row):
@@ -218,7 +220,7 @@ def map(texts: list, boxes: list) -> list[InvoiceItem]:
         if not normalized_description:
             if result_rows:
                 result_rows[-1]["description"] = (
-                    f"{result_rows[-1]['description']} {' '.join(item['text'] for item in row)}"
+                    f"{result_rows[-1]['description']} {' '.join(item.text for item in row)}"
                 ).strip()
             continue
         if normalized_description == "total" and pending_numeric_items:
@@ -3,9 +3,9 @@ from __future__ import annotations
 
 from ..models import MeterItem
 from ._utils import (
-    build_items,
+    OcrItem,
+    OcrItems,
     format_date,
-    group_items_by_row,
     normalize_text,
     parse_decimal,
     parse_int,
@@ -39,18 +39,18 @@ HEADER_KEYWORDS = {
 }
 
 
-def _find_section_start(rows: list[list[dict]]) -> int | None:
+def _find_section_start(rows: list[list[OcrItem]]) -> int | None:
     for index, row in enumerate(rows):
-        row_text = " ".join(item["text"] for item in row)
+        row_text = " ".join(item.text for item in row)
         normalized = normalize_text(row_text)
         if any(title in normalized for title in SECTION_TITLES):
             return index
     return None
 
 
-def _find_header_index(rows: list[list[dict]], start: int) -> int | None:
+def _find_header_index(rows: list[list[OcrItem]], start: int) -> int | None:
     for index in range(start, len(rows)):
-        row_text = " ".join(item["text"] for item in rows[index])
+        row_text = " ".join(item.text for item in rows[index])
         normalized = normalize_text(row_text)
         matches = [key for key in HEADER_KEYWORDS if key in normalized]
         if len(matches) >= 3 and "medidor" in normalized:
@@ -58,7 +58,7 @@ def _find_header_index(rows: list[list[dict]], start: int) -> int | None:
     return None
 
 
-def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
+def _infer_column_positions(header_items: list[OcrItem]) -> dict[str, float]:
     positions: dict[str, float] = {}
     ordered_mapping = [
         ("meter_number", ["medidor"]),
@@ -74,18 +74,18 @@ def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
     used = set()
     for column, keywords in ordered_mapping:
         for item in header_items:
-            if item["index"] in used:
+            if item.index in used:
                 continue
-            text = normalize_text(item["text"])
+            text = normalize_text(item.text)
             if any(keyword in text for keyword in keywords):
-                positions[column] = item.get("x_center", item["x"])
-                used.add(item["index"])
+                positions[column] = item.x_center
+                used.add(item.index)
                 break
     return positions
 
 
 def _assign_row_items(
-    items: list[dict],
+    items: list[OcrItem],
     column_positions: dict[str, float],
 ) -> dict[str, str]:
     row = {column: "" for column in COLUMN_ORDER}
@@ -98,7 +98,7 @@ def _assign_row_items(
             (sorted_positions[index][1] + sorted_positions[index + 1][1]) / 2
         )
     for item in items:
-        x_value = item["x_center"]
+        x_value = item.x_center
         column_index = 0
         for boundary in boundaries:
             if x_value < boundary:
@@ -108,15 +108,18 @@ def _assign_row_items(
             min(column_index, len(sorted_positions) - 1)
         ][0]
         if row[column_name]:
-            row[column_name] = f"{row[column_name]} {item['text']}".strip()
+            row[column_name] = f"{row[column_name]} {item.text}".strip()
         else:
-            row[column_name] = item["text"]
+            row[column_name] = item.text
     return row
 
 
 def map(texts: list, boxes: list) -> list[MeterItem]:
-    items = build_items(texts, boxes)
-    rows = group_items_by_row(items)
+    return map_items(OcrItems(texts, boxes))
+
+
+def map_items(items: OcrItems) -> list[MeterItem]:
+    rows = items.rows()
     section_start = _find_section_start(rows)
     if section_start is None:
         return []
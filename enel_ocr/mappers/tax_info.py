@@ -4,7 +4,7 @@ from __future__ import annotations
 import re
 
 from ..models import TaxInfo
-from ._utils import build_items, group_items_by_row, normalize_text
+from ._utils import OcrItems, normalize_text
 
 
 def _extract_after_label(text: str, labels: list[str]) -> str:
@@ -76,9 +76,8 @@ def _extract_date_after_label(text: str, labels: list[str]) -> str:
     return ""
 
 def map(texts: list, boxes: list) -> TaxInfo:
-    items = build_items(texts, boxes)
-    rows = group_items_by_row(items)
-    lines = [" ".join(item["text"] for item in row).strip() for row in rows]
+    rows = OcrItems(texts, boxes).rows()
+    lines = [" ".join(item.text for item in row).strip() for row in rows]
     lines = [line for line in lines if line]
     full_text = " ".join(lines)
     invoice_number = ""
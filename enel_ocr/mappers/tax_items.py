@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from ..models import TaxItem
-from ._utils import build_items, group_items_by_row, normalize_text, parse_decimal
+from ._utils import OcrItem, OcrItems, normalize_text, parse_decimal
 
 COLUMN_ORDER = [
     "tax_name",
@@ -19,30 +19,30 @@ HEADER_KEYWORDS = {
 }
 
 
-def _row_like_header(row: list[dict]) -> bool:
-    row_text = " ".join(item["text"] for item in row)
+def _row_like_header(row: list[OcrItem]) -> bool:
+    row_text = " ".join(item.text for item in row)
     normalized = normalize_text(row_text)
     matches = [key for key in HEADER_KEYWORDS if key in normalized]
     has_tributos = "tributos" in normalized
     return has_tributos and (len(matches) >= 2 or len(row) <= 2)
 
 
-def _row_extends_header(row: list[dict]) -> bool:
-    row_text = " ".join(item["text"] for item in row)
+def _row_extends_header(row: list[OcrItem]) -> bool:
+    row_text = " ".join(item.text for item in row)
     normalized = normalize_text(row_text)
     if any(char.isdigit() for char in normalized):
         return False
     return any(key in normalized for key in HEADER_KEYWORDS)
 
 
-def _find_header_index(rows: list[list[dict]]) -> int | None:
+def _find_header_index(rows: list[list[OcrItem]]) -> int | None:
     for index, row in enumerate(rows):
         if _row_like_header(row):
             return index
     return None
 
 
-def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
+def _infer_column_positions(header_items: list[OcrItem]) -> dict[str, float]:
     positions: dict[str, float] = {}
     ordered_mapping = [
         ("tax_name", ["tributos"]),
@@ -53,18 +53,18 @@ def _infer_column_positions(header_items: list[dict]) -> dict[str, float]:
     used = set()
     for column, keywords in ordered_mapping:
         for item in header_items:
-            if item["index"] in used:
+            if item.index in used:
                 continue
-            text = normalize_text(item["text"])
+            text = normalize_text(item.text)
             if any(keyword in text for keyword in keywords):
-                positions[column] = item.get("x_center", item["x"])
-                used.add(item["index"])
+                positions[column] = item.x_center
+                used.add(item.index)
                 break
     return positions
 
 
 def _assign_row_items(
-    items: list[dict],
+    items: list[OcrItem],
     column_positions: dict[str, float],
 ) -> dict[str, str]:
     row = {column: "" for column in COLUMN_ORDER}
@@ -77,7 +77,7 @@ def _assign_row_items(
             (sorted_positions[index][1] + sorted_positions[index + 1][1]) / 2
         )
     for item in items:
-        x_value = item["x_center"]
+        x_value = item.x_center
         column_index = 0
         for boundary in boundaries:
             if x_value < boundary:
@@ -87,15 +87,14 @@ def _assign_row_items(
             min(column_index, len(sorted_positions) - 1)
         ][0]
         if row[column_name]:
-            row[column_name] = f"{row[column_name]} {item['text']}".strip()
+            row[column_name] = f"{row[column_name]} {item.text}".strip()
         else:
-            row[column_name] = item["text"]
+            row[column_name] = item.text
     return row
 
 
 def map(texts: list, boxes: list) -> list[TaxItem]:
-    items = build_items(texts, boxes)
-    rows = group_items_by_row(items)
+    rows = OcrItems(texts, boxes).rows()
     header_index = _find_header_index(rows)
     if header_index is None:
         return []
@@ -0,0 +1,254 @@
+# -*- coding: ascii -*-
+"""
+Contadores, gauges e histogramas de tempo em memoria, exportados no formato
+texto do Prometheus (render_metrics).
+
+Com METRICS_DIR definido, cada processo (workers do gunicorn e processos de
+OCR) grava um snapshot em METRICS_DIR/<pid>.json a cada FLUSH_INTERVAL
+segundos e na saida, e render_metrics soma os arquivos de todos eles. Os
+gauges de processos que ja terminaram sao ignorados; os contadores deles
+continuam somando ate o diretorio ser limpo.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock, Timer
+from typing import Dict, Iterator, List, Tuple
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+FLUSH_INTERVAL = 1.0
+PREFIX = "enel_ocr_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (nome, ((label, valor), ...))
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class Metrics:
+    def __init__(self, directory: str = "") -> None:
+        self._directory = Path(directory) if directory else None
+        self._lock = Lock()
+        self._counters: dict[_Key, float] = {}
+        self._gauges: dict[_Key, float] = {}
+        # Por serie: contagem em cada bucket (mais +Inf), soma e total.
+        self._histograms: dict[_Key, list] = {}
+        self._flush_lock = Lock()
+        self._flushed_at = 0.0
+        self._flush_timer: Timer | None = None
+
+    def increment(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._maybe_flush()
+
+    def gauge_add(self, name: str, delta: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + delta
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            series[0][bisect_left(BUCKETS, value)] += 1
+            series[1] += value
+            series[2] += 1
+        self._maybe_flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[n, dict(l), v] for (n, l), v in self._counters.items()],
+                "gauges": [[n, dict(l), v] for (n, l), v in self._gauges.items()],
+                "histograms": [
+                    [n, dict(l), list(s[0]), s[1], s[2]]
+                    for (n, l), s in self._histograms.items()
+                ],
+            }
+
+    def _maybe_flush(self) -> None:
+        if self._directory is None:
+            return
+        if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+            return
+        # Grava depois o que mudou agora, mesmo que o processo fique ocioso.
+        # Conferir e criar sob o lock: pedidos concorrentes criam um timer so.
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = Timer(FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        if self._directory is None:
+            return
+        with self._flush_lock:
+            self._flushed_at = time.monotonic()
+            with self._lock:
+                self._flush_timer = None
+            self._directory.mkdir(parents=True, exist_ok=True)
+            path = self._directory / f"{os.getpid()}.json"
+            temporary = path.with_suffix(".tmp")
+            temporary.write_text(json.dumps(self.snapshot()), encoding="ascii")
+            os.replace(temporary, path)
+
+    def snapshots(self) -> List[dict]:
+        """Snapshot deste processo mais os dos outros processos em METRICS_DIR."""
+        if self._directory is None:
+            return [self.snapshot()]
+        self.flush()
+        found = []
+        for path in self._directory.glob("*.json"):
+            if not path.stem.isdigit():
+                continue
+            try:
+                snapshot = json.loads(path.read_text(encoding="ascii"))
+            except (OSError, ValueError):
+                continue
+            if not _alive(int(path.stem)):
+                snapshot["gauges"] = []
+            found.append(snapshot)
+        return found
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = Metrics(METRICS_DIR)
+atexit.register(REGISTRY.flush)
+
+# Tempos da requisicao atual, para o cabecalho Server-Timing.
+_TIMINGS: ContextVar[Dict[str, float] | None] = ContextVar("timings", default=None)
+
+
+def increment(name: str, value: float = 1.0, **labels) -> None:
+    REGISTRY.increment(name, value, **labels)
+
+
+def observe(name: str, seconds: float, timing: str | None = None, **labels) -> None:
+    REGISTRY.observe(name, seconds, **labels)
+    timings = _TIMINGS.get()
+    if timing and timings is not None:
+        timings[timing] = timings.get(timing, 0.0) + seconds
+
+
+@contextmanager
+def timed(name: str, timing: str | None = None, **labels) -> Iterator[None]:
+    """Mede o bloco no histograma name e, se timing, no Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, timing, **labels)
+
+
+@contextmanager
+def tracked(name: str, **labels) -> Iterator[None]:
+    """Gauge com quantos blocos estao em andamento."""
+    REGISTRY.gauge_add(name, 1, **labels)
+    try:
+        yield
+    finally:
+        REGISTRY.gauge_add(name, -1, **labels)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    Junta os tempos medidos com timing nesta thread ate o fim do bloco.
+    Trabalho feito em outros processos (OCR_WORKERS) nao entra.
+    """
+    timings: dict[str, float] = {}
+    token = _TIMINGS.set(timings)
+    try:
+        yield timings
+    finally:
+        _TIMINGS.reset(token)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+
+
+def _labels(labels: dict, extra: Tuple[str, str] | None = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        (label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for label, value in items
+    )
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics(registry: Metrics | None = None) -> str:
+    """Soma os snapshots dos processos no formato texto do Prometheus."""
+    counters: dict[_Key, float] = {}
+    gauges: dict[_Key, float] = {}
+    histograms: dict[_Key, list] = {}
+    for snapshot in (registry or REGISTRY).snapshots():
+        for name, labels, value in snapshot["counters"]:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, value in snapshot["gauges"]:
+            key = _key(name, labels)
+            gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = _key(name, labels)
+            series = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            series[0] = [a + b for a, b in zip(series[0], buckets)]
+            series[1] += total
+            series[2] += count
+
+    lines: list[str] = []
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        typed: set[str] = set()
+        for (name, labels), value in sorted(values.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            lines.append(f"{PREFIX}{name}{_labels(dict(labels))} {_format(value)}")
+    typed = set()
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        cumulative = 0
+        for bound, bucket in zip((*BUCKETS, "+Inf"), buckets):
+            cumulative += bucket
+            le = ("le", bound if bound == "+Inf" else _format(bound))
+            bucket_labels = _labels(dict(labels), le)
+            lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_labels(dict(labels))} {_format(total)}")
+        lines.append(f"{PREFIX}{name}_count{_labels(dict(labels))} {count}")
+    return "\n".join(lines) + "\n"
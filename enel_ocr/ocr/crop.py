@@ -9,32 +9,108 @@ from PIL import Image
 
 
 class ImageCropper:
-    def __init__(self, image_bytes: bytes) -> None:
-        self._image = Image.open(io.BytesIO(image_bytes))
-        self._image.load()
+    """
+    Recorta regioes de uma imagem RGB ou em tons de cinza (bytes de imagem
+    ou array ja renderizado). origin e a posicao do array na pagina, para
+    imagens renderizadas com clip; as coordenadas dos recortes sao sempre da
+    pagina.
+
+    A imagem fica num unico array contiguo e somente leitura e os recortes
+    dentro dele sao views, sem copia. As variantes em cinza e reduzidas sao
+    calculadas uma vez, no primeiro recorte que as pede.
+    """
+
+    def __init__(
+        self,
+        image: bytes | np.ndarray,
+        origin: Tuple[int, int] = (0, 0),
+    ) -> None:
+        if isinstance(image, np.ndarray):
+            array = np.ascontiguousarray(image)
+        else:
+            with Image.open(io.BytesIO(image)) as decoded:
+                mode = "L" if decoded.mode == "L" else "RGB"
+                array = np.asarray(decoded.convert(mode))
+        array.flags.writeable = False
+        self._array = array
+        self._origin = origin
+        self._variants: dict[Tuple[bool, float], np.ndarray] = {(False, 1.0): array}
 
     @property
     def size(self) -> Tuple[int, int]:
-        return self._image.size
+        height, width = self._array.shape[:2]
+        return width, height
+
+    def _variant(self, gray: bool, scale: float) -> np.ndarray:
+        gray = gray and self._array.ndim == 3
+        key = (gray, float(scale))
+        array = self._variants.get(key)
+        if array is None:
+            if scale == 1:
+                image = Image.fromarray(self._array).convert("L")
+            else:
+                image = Image.fromarray(self._variant(gray, 1.0))
+                width, height = image.size
+                size = (max(round(width * scale), 1), max(round(height * scale), 1))
+                image = image.resize(size, Image.BILINEAR)
+            array = np.asarray(image)
+            array.flags.writeable = False
+            self._variants[key] = array
+        return array
 
     def crop(self, coord: Tuple[int, int, int, int]) -> bytes:
-        x, y, width, height = coord
-        box = (x, y, x + width, y + height)
-        cropped = self._image.crop(box)
+        cropped = Image.fromarray(self.crop_ndarray(coord))
         out = io.BytesIO()
         cropped.save(out, format="PNG")
         return out.getvalue()
 
-    def crop_ndarray(self, coord: Tuple[int, int, int, int]) -> np.ndarray:
+    def crop_ndarray(
+        self,
+        coord: Tuple[int, int, int, int],
+        gray: bool = False,
+        scale: float = 1.0,
+    ) -> np.ndarray:
+        """
+        Recorte somente leitura (view quando cabe na imagem). gray devolve um
+        array 2D; com scale != 1 o recorte vem da imagem reduzida/ampliada e
+        as coordenadas dele ficam multiplicadas por scale.
+        """
+        array = self._variant(gray, scale)
         x, y, width, height = coord
-        box = (x, y, x + width, y + height)
-        cropped = self._image.crop(box).convert("RGB")
-        return np.array(cropped)
+        left = x - self._origin[0]
+        top = y - self._origin[1]
+        if scale != 1:
+            left, top = round(left * scale), round(top * scale)
+            width, height = round(width * scale), round(height * scale)
+        image_height, image_width = array.shape[:2]
+        if (
+            left >= 0
+            and top >= 0
+            and left + width <= image_width
+            and top + height <= image_height
+        ):
+            return array[top : top + height, left : left + width]
+
+        # Fora dos limites o recorte e completado com preto, como no PIL.
+        cropped = np.zeros((height, width) + array.shape[2:], dtype=np.uint8)
+        src_left = max(left, 0)
+        src_top = max(top, 0)
+        src_right = min(left + width, image_width)
+        src_bottom = min(top + height, image_height)
+        if src_left < src_right and src_top < src_bottom:
+            cropped[
+                src_top - top : src_bottom - top, src_left - left : src_right - left
+            ] = array[src_top:src_bottom, src_left:src_right]
+        cropped.flags.writeable = False
+        return cropped
 
     def crop_many_ndarray(
-        self, coords: Iterable[Tuple[int, int, int, int]]
+        self,
+        coords: Iterable[Tuple[int, int, int, int]],
+        gray: bool = False,
+        scale: float = 1.0,
     ) -> List[np.ndarray]:
-        return [self.crop_ndarray(coord) for coord in coords]
+        return [self.crop_ndarray(coord, gray=gray, scale=scale) for coord in coords]
 
 
 def crop_image_bytes(image_bytes: bytes, coord: Tuple[int, int, int, int]) -> bytes:
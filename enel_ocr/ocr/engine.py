@@ -1,18 +1,162 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import List, Tuple
+import copy
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Sequence, Tuple
 
 import numpy as np
-from paddleocr import PaddleOCR
 
+from .. import metrics
 
-def init_ocr() -> PaddleOCR:
-    return PaddleOCR(
+if TYPE_CHECKING:
+    from paddleocr import PaddleOCR
+
+    from ..cache import TieredCache
+
+OcrResult = Tuple[List[str], List[List[List[float]]], List[float]]
+
+# Parametros do Paddle que mudam a saida do OCR (threads, por exemplo, nao
+# mudam) e entram na chave do cache junto com os pixels.
+_CACHE_ARGS = (
+    "lang",
+    "ocr_version",
+    "det_algorithm",
+    "det_model_dir",
+    "det_limit_side_len",
+    "det_limit_type",
+    "det_db_thresh",
+    "det_db_box_thresh",
+    "det_db_unclip_ratio",
+    "det_box_type",
+    "use_dilation",
+    "rec_algorithm",
+    "rec_model_dir",
+    "rec_image_shape",
+    "rec_char_dict_path",
+    "use_space_char",
+    "use_angle_cls",
+    "drop_score",
+)
+# Muda quando o formato gravado no cache muda.
+_CACHE_FORMAT = "1"
+
+
+def init_ocr(
+    cpu_threads: int | None = None, cache: TieredCache | None = None
+) -> PaddleOCR | CachedOcr:
+    # Paddle so e importado aqui: quem usa outra engine (ex.: o stub de
+    # benchmarks/) nao precisa dele instalado.
+    from paddleocr import PaddleOCR
+
+    options = {}
+    if cpu_threads:
+        options["cpu_threads"] = cpu_threads
+    ocr = PaddleOCR(
         use_angle_cls=False,
         lang="pt",
-        ocr_version="PP-OCRv3"
+        ocr_version="PP-OCRv3",
+        **options,
     )
+    return CachedOcr(ocr, cache) if cache is not None else ocr
+
+
+def _engine_config(ocr) -> str:
+    args = getattr(ocr, "args", None)
+    if args is None:
+        return f"{type(ocr).__module__}.{type(ocr).__qualname__}"
+    values = {name: str(getattr(args, name, None)) for name in _CACHE_ARGS}
+    return json.dumps(values, sort_keys=True)
+
+
+def _encode_result(result: OcrResult) -> bytes:
+    texts, boxes, scores = result
+    payload = [
+        list(texts),
+        [[[float(x), float(y)] for x, y in box] for box in boxes],
+        [float(score) for score in scores],
+    ]
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def _decode_result(value: bytes) -> OcrResult:
+    texts, boxes, scores = json.loads(value)
+    return texts, boxes, scores
+
+
+class CachedOcr:
+    """
+    Engine com cache da saida do OCR por imagem. A chave e o hash dos pixels
+    (com shape e dtype), do modo da chamada e da configuracao da engine, entao
+    uma regiao identica a de outra fatura (nome, endereco, cabecalhos) vira
+    uma consulta ao cache. Imagens repetidas no mesmo lote rodam uma vez so.
+    """
+
+    def __init__(self, ocr, cache: TieredCache) -> None:
+        self.engine = ocr
+        self._cache = cache
+        self._prefix = f"ocr{_CACHE_FORMAT}:{_engine_config(ocr)}".encode("utf-8")
+
+    def key(self, image_np: np.ndarray, mode: str) -> str:
+        digest = hashlib.blake2b(self._prefix, digest_size=20)
+        digest.update(f":{mode}:{image_np.shape}:{image_np.dtype.str}:".encode())
+        if image_np.flags.c_contiguous:
+            digest.update(image_np)
+        else:
+            # Recortes sao views da pagina: cada linha e contigua, entao o
+            # hash vai linha a linha sem copiar o recorte.
+            for row in image_np:
+                digest.update(np.ascontiguousarray(row))
+        return digest.hexdigest()
+
+    def _get(self, key: str) -> OcrResult | None:
+        value = self._cache.get(key)
+        metrics.increment(
+            "ocr_cache_requests_total", result="miss" if value is None else "hit"
+        )
+        return None if value is None else _decode_result(value)
+
+    def ocr_batch(
+        self, images: Sequence[np.ndarray], single_line: Sequence[bool]
+    ) -> List[OcrResult]:
+        results: list[OcrResult | None] = []
+        # Chave -> posicoes em images das imagens ainda sem resultado.
+        missing: dict[str, list[int]] = {}
+        for index, (image_np, is_single_line) in enumerate(zip(images, single_line)):
+            key = self.key(image_np, "line" if is_single_line else "batch")
+            result = None if key in missing else self._get(key)
+            if result is None:
+                missing.setdefault(key, []).append(index)
+            results.append(result)
+        if missing:
+            first = [indices[0] for indices in missing.values()]
+            found = run_ocr_batch(
+                self.engine,
+                [images[index] for index in first],
+                [single_line[index] for index in first],
+            )
+            # Um set_many por lote: com o disco, um commit em vez de um por regiao.
+            self._cache.set_many(
+                (key, _encode_result(result))
+                for key, result in zip(missing, found)
+            )
+            for indices, result in zip(missing.values(), found):
+                results[indices[0]] = result
+                for index in indices[1:]:
+                    results[index] = copy.deepcopy(result)
+        return results
+
+    def ocr(self, image_np: np.ndarray, cls: bool = False) -> list:
+        # Mesmo formato de PaddleOCR.ocr, para run_ocr (deteccao de layout).
+        del cls
+        key = self.key(image_np, "ocr")
+        result = self._get(key)
+        if result is None:
+            result = run_ocr(self.engine, image_np)
+            self._cache.set(key, _encode_result(result))
+        return [[[box, (text, score)] for text, box, score in zip(*result)]]
 
 
 def run_ocr(
@@ -29,3 +173,128 @@ def run_ocr(
     scores = [float(score) for _box, (_text, score) in lines]
 
     return texts, boxes, scores
+
+
+def _detect_lines(ocr: PaddleOCR, image_np: np.ndarray) -> list:
+    from paddleocr.paddleocr import predict_system
+
+    dt_boxes, _elapse = ocr.text_detector(image_np)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return []
+    return predict_system.sorted_boxes(dt_boxes)
+
+
+def _crop_line(ocr: PaddleOCR, image_np: np.ndarray, box) -> np.ndarray:
+    from paddleocr.paddleocr import predict_system
+
+    points = copy.deepcopy(box)
+    if ocr.args.det_box_type == "quad":
+        return predict_system.get_rotate_crop_image(image_np, points)
+    return predict_system.get_minarea_rect_crop(image_np, points)
+
+
+def _full_box(image_np: np.ndarray) -> np.ndarray:
+    height, width = image_np.shape[:2]
+    return np.array(
+        [[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32
+    )
+
+
+def _as_color(image_np: np.ndarray) -> np.ndarray:
+    # Detector e reconhecedor esperam 3 canais; recortes em cinza sao
+    # expandidos aqui, um por vez, e a pagina continua com um canal so.
+    if image_np.ndim == 2:
+        return np.repeat(image_np[:, :, None], 3, axis=2)
+    return image_np
+
+
+def run_ocr_batch(
+    ocr: PaddleOCR,
+    images: Sequence[np.ndarray],
+    single_line: Sequence[bool] | None = None,
+) -> List[OcrResult]:
+    """
+    Detecta linhas em cada imagem e reconhece todas as linhas de todas as
+    imagens numa unica chamada ao reconhecedor (agrupada por rec_batch_num).
+    Imagens marcadas em single_line pulam a deteccao e vao inteiras para o
+    reconhecedor, com a caixa cobrindo o recorte todo.
+    Retorna um (texts, boxes, scores) por imagem, como run_ocr.
+
+    Engines que nao sao do Paddle podem tratar o lote inteiro definindo
+    ocr_batch(images, single_line) com esse mesmo retorno.
+    """
+    if single_line is None:
+        single_line = [False] * len(images)
+    ocr_batch = getattr(ocr, "ocr_batch", None)
+    if ocr_batch is not None:
+        return ocr_batch(images, single_line)
+    detected = []
+    line_crops = []
+    for image_np, is_single_line in zip(images, single_line):
+        image_np = _as_color(image_np)
+        if is_single_line:
+            detected.append([_full_box(image_np)])
+            line_crops.append(image_np)
+            continue
+        boxes = _detect_lines(ocr, image_np)
+        detected.append(boxes)
+        line_crops.extend(_crop_line(ocr, image_np, box) for box in boxes)
+
+    rec_res = []
+    if line_crops:
+        rec_res, _elapse = ocr.text_recognizer(line_crops)
+
+    results: List[OcrResult] = []
+    offset = 0
+    for boxes in detected:
+        texts, kept_boxes, scores = [], [], []
+        for box, (text, score) in zip(boxes, rec_res[offset : offset + len(boxes)]):
+            if score < ocr.drop_score:
+                continue
+            texts.append(text)
+            kept_boxes.append(box.tolist())
+            scores.append(float(score))
+        offset += len(boxes)
+        results.append((texts, kept_boxes, scores))
+    return results
+
+
+def run_ocr_parallel(
+    engines: Sequence[PaddleOCR],
+    images: Sequence[np.ndarray],
+    single_line: Sequence[bool] | None = None,
+) -> List[OcrResult]:
+    """
+    Divide as imagens entre as engines, equilibrando a area de cada parte, e
+    roda run_ocr_batch de cada parte numa thread (o Paddle libera o GIL na
+    inferencia). Retorna os resultados na ordem de images.
+    """
+    if single_line is None:
+        single_line = [False] * len(images)
+    if len(engines) == 1 or len(images) <= 1:
+        return run_ocr_batch(engines[0], images, single_line)
+
+    shards: list[list[int]] = [[] for _ in engines]
+    loads = [0] * len(engines)
+    areas = [image.shape[0] * image.shape[1] for image in images]
+    for index in sorted(range(len(images)), key=areas.__getitem__, reverse=True):
+        target = loads.index(min(loads))
+        shards[target].append(index)
+        loads[target] += areas[index]
+    work = [(engine, sorted(shard)) for engine, shard in zip(engines, shards) if shard]
+
+    results: List[OcrResult] = [([], [], [])] * len(images)
+    with ThreadPoolExecutor(max_workers=len(work)) as executor:
+        futures = [
+            executor.submit(
+                run_ocr_batch,
+                engine,
+                [images[index] for index in shard],
+                [single_line[index] for index in shard],
+            )
+            for engine, shard in work
+        ]
+        for (_engine, shard), future in zip(work, futures):
+            for index, result in zip(shard, future.result()):
+                results[index] = result
+    return results
@@ -0,0 +1,90 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .engine import OcrResult
+
+Rect = Tuple[int, int, int, int]
+
+MIN_OVERLAP = 0.5
+
+
+def union_rect(rects: Sequence[Rect]) -> Rect:
+    x0 = min(x for x, _y, _w, _h in rects)
+    y0 = min(y for _x, y, _w, _h in rects)
+    x1 = max(x + w for x, _y, w, _h in rects)
+    y1 = max(y + h for _x, y, _w, h in rects)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def contains(outer: Rect, inner: Rect) -> bool:
+    ox, oy, ow, oh = outer
+    x, y, w, h = inner
+    return ox <= x and oy <= y and x + w <= ox + ow and y + h <= oy + oh
+
+
+def build_bands(rects: Sequence[Rect], merge_all: bool = False) -> List[Rect]:
+    """
+    Agrupa regioes que se sobrepoem na vertical em faixas horizontais.
+    Com merge_all, devolve uma unica faixa cobrindo todas as regioes.
+    """
+    if not rects:
+        return []
+    if merge_all:
+        return [union_rect(rects)]
+    groups: list[list[Rect]] = []
+    for rect in sorted(rects, key=lambda item: item[1]):
+        if groups:
+            _x, y, _w, h = union_rect(groups[-1])
+            if rect[1] < y + h:
+                groups[-1].append(rect)
+                continue
+        groups.append([rect])
+    return [union_rect(group) for group in groups]
+
+
+def _bounds(box) -> tuple[float, float, float, float]:
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _overlap_ratio(bounds, rect: Rect) -> float:
+    x0, y0, x1, y1 = bounds
+    rx, ry, rw, rh = rect
+    width = min(x1, rx + rw) - max(x0, rx)
+    height = min(y1, ry + rh) - max(y0, ry)
+    if width <= 0 or height <= 0:
+        return 0.0
+    area = (x1 - x0) * (y1 - y0)
+    if area <= 0:
+        return 0.0
+    return (width * height) / area
+
+
+def assign_to_regions(
+    bands: Sequence[Rect],
+    band_results: Sequence[OcrResult],
+    rects: Sequence[Rect],
+) -> List[OcrResult]:
+    """
+    Distribui as linhas lidas em cada faixa para as regioes que cobrem ao
+    menos MIN_OVERLAP da caixa, com as caixas em coordenadas do recorte.
+    """
+    assigned: List[OcrResult] = [([], [], []) for _ in rects]
+    for (band_x, band_y, _w, _h), (texts, boxes, scores) in zip(bands, band_results):
+        for text, box, score in zip(texts, boxes, scores):
+            page_box = [[point[0] + band_x, point[1] + band_y] for point in box]
+            bounds = _bounds(page_box)
+            for index, rect in enumerate(rects):
+                if _overlap_ratio(bounds, rect) < MIN_OVERLAP:
+                    continue
+                region_texts, region_boxes, region_scores = assigned[index]
+                region_texts.append(text)
+                region_boxes.append(
+                    [[point[0] - rect[0], point[1] - rect[1]] for point in page_box]
+                )
+                region_scores.append(score)
+    return assigned
@@ -1,26 +1,113 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from typing import Final
+from dataclasses import dataclass
+from typing import Final, Tuple
 
 import fitz  # PyMuPDF
+import numpy as np
 
 DEFAULT_DPI: Final[int] = 300
 
 
-def pdf_page_to_image_bytes(pdf_bytes: bytes, page_number: int, dpi: int = DEFAULT_DPI) -> bytes:
+@dataclass(frozen=True)
+class PageRaster:
+    pixels: np.ndarray
+    x: int = 0
+    y: int = 0
+
+
+class _PixmapBuffer:
+    """Expoe as amostras do pixmap sem copia e o mantem vivo junto do array."""
+
+    def __init__(self, pix: fitz.Pixmap) -> None:
+        self._pix = pix
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": (pix.height, pix.width, pix.n),
+            "strides": (pix.stride, pix.n, 1),
+            "typestr": "|u1",
+            "data": (pix.samples_ptr, True),
+        }
+
+
+def _open_page(doc: fitz.Document, page_number: int) -> fitz.Page:
     if page_number < 1:
         raise ValueError("page_number deve ser 1 ou maior")
+    if page_number > doc.page_count:
+        raise ValueError("page_number maior que o total de paginas")
+    return doc.load_page(page_number - 1)
 
+
+def pdf_page_to_image_bytes(pdf_bytes: bytes, page_number: int, dpi: int = DEFAULT_DPI) -> bytes:
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     try:
-        if page_number > doc.page_count:
-            raise ValueError("page_number maior que o total de paginas")
-
-        page = doc.load_page(page_number - 1)
+        page = _open_page(doc, page_number)
         zoom = dpi / 72.0
         matrix = fitz.Matrix(zoom, zoom)
         pix = page.get_pixmap(matrix=matrix, alpha=False)
         return pix.tobytes("png")
     finally:
         doc.close()
+
+
+class PdfDocument:
+    """
+    Mantem o PDF aberto para renderizar varias areas sem reabrir o arquivo.
+    Recortes (clip) sao (x, y, width, height) em pixels a DEFAULT_DPI, o
+    mesmo sistema de coordenadas dos layouts, qualquer que seja o dpi pedido.
+    """
+
+    def __init__(self, pdf_bytes: bytes) -> None:
+        self._doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        self._pages: dict[int, fitz.Page] = {}
+
+    def __enter__(self) -> PdfDocument:
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pages.clear()
+        self._doc.close()
+
+    @property
+    def page_count(self) -> int:
+        return self._doc.page_count
+
+    def _page(self, page_number: int) -> fitz.Page:
+        page = self._pages.get(page_number)
+        if page is None:
+            page = self._pages[page_number] = _open_page(self._doc, page_number)
+        return page
+
+    def words(self, page_number: int = 1) -> list[tuple]:
+        # (x0, y0, x1, y1, texto, bloco, linha, palavra), em pontos.
+        return self._page(page_number).get_text("words")
+
+    def render(
+        self,
+        page_number: int = 1,
+        dpi: int = DEFAULT_DPI,
+        clip: Tuple[int, int, int, int] | None = None,
+        gray: bool = False,
+    ) -> PageRaster:
+        page = self._page(page_number)
+        zoom = dpi / 72.0
+        matrix = fitz.Matrix(zoom, zoom)
+        rect = None
+        if clip is not None:
+            x, y, width, height = clip
+            rect = fitz.Rect(x, y, x + width, y + height) / (DEFAULT_DPI / 72.0)
+            rect = rect & page.rect
+        colorspace = fitz.csGRAY if gray else fitz.csRGB
+        pix = page.get_pixmap(
+            matrix=matrix, colorspace=colorspace, alpha=False, clip=rect
+        )
+        pixels = np.asarray(_PixmapBuffer(pix))
+        if gray:
+            # Um canal so: (altura, largura), um terco da memoria do RGB.
+            pixels = pixels[:, :, 0]
+        return PageRaster(pixels=pixels, x=pix.x, y=pix.y)
+
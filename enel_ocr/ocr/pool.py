@@ -0,0 +1,90 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from threading import Condition
+from typing import Callable, Generic, Iterator, TypeVar
+
+from .. import metrics
+
+T = TypeVar("T")
+
+
+class OcrPoolTimeout(TimeoutError):
+    pass
+
+
+class OcrPool(Generic[T]):
+    """
+    Conjunto de ate size engines de OCR, criadas sob demanda. Cada engine e
+    usada por uma thread por vez; checkout espera ate timeout segundos por
+    uma livre (checkout_many, por count livres ao mesmo tempo) e levanta
+    OcrPoolTimeout se nao vagarem.
+    """
+
+    def __init__(self, factory: Callable[[], T], size: int = 1) -> None:
+        if size < 1:
+            raise ValueError("size deve ser 1 ou maior")
+        self._factory = factory
+        self._size = size
+        self._idle: list[T] = []
+        self._created = 0
+        self._condition = Condition()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _acquire(self, count: int, timeout: float | None) -> list[T]:
+        if count > self._size:
+            raise ValueError("count maior que o tamanho do pool")
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._condition:
+            # Pega as count engines de uma vez para dois checkouts parciais
+            # nao ficarem esperando um pelo outro.
+            while len(self._idle) + self._size - self._created < count:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    metrics.increment("pool_timeouts_total", pool="engines")
+                    raise OcrPoolTimeout("nenhuma engine de OCR livre")
+                self._condition.wait(remaining)
+            engines = [self._idle.pop() for _ in range(min(count, len(self._idle)))]
+            missing = count - len(engines)
+            self._created += missing
+        waited = time.monotonic() - start
+        metrics.observe("pool_wait_seconds", waited, "pool_wait", pool="engines")
+        try:
+            for _ in range(missing):
+                engines.append(self._factory())
+        except BaseException:
+            with self._condition:
+                self._created -= count - len(engines)
+                self._idle.extend(engines)
+                self._condition.notify_all()
+            raise
+        return engines
+
+    def _release(self, engines: list[T]) -> None:
+        with self._condition:
+            self._idle.extend(engines)
+            self._condition.notify_all()
+
+    @contextmanager
+    def checkout(self, timeout: float | None = None) -> Iterator[T]:
+        engines = self._acquire(1, timeout)
+        try:
+            yield engines[0]
+        finally:
+            self._release(engines)
+
+    @contextmanager
+    def checkout_many(
+        self, count: int, timeout: float | None = None
+    ) -> Iterator[list[T]]:
+        engines = self._acquire(count, timeout)
+        try:
+            yield engines
+        finally:
+            self._release(engines)
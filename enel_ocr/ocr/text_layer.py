@@ -0,0 +1,101 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Sequence, Tuple
+
+from .pdf import DEFAULT_DPI, PdfDocument
+
+if TYPE_CHECKING:
+    from .engine import OcrResult
+
+Rect = Tuple[int, int, int, int]
+
+_POINTS_TO_PIXELS = DEFAULT_DPI / 72.0
+
+
+class TextLayer:
+    """
+    Palavras da camada de texto de uma pagina do PDF, em pixels a
+    DEFAULT_DPI. read devolve, para uma regiao do layout, o mesmo
+    (texts, boxes, scores) do OCR: uma entrada por trecho de linha, com as
+    caixas relativas a regiao e score 1.0.
+    """
+
+    def __init__(self, words: Sequence[tuple]) -> None:
+        self._words = [
+            (
+                x0 * _POINTS_TO_PIXELS,
+                y0 * _POINTS_TO_PIXELS,
+                x1 * _POINTS_TO_PIXELS,
+                y1 * _POINTS_TO_PIXELS,
+                text,
+                (block_no, line_no),
+            )
+            for x0, y0, x1, y1, text, block_no, line_no, _word_no in words
+            if text.strip()
+        ]
+
+    @classmethod
+    def from_document(cls, document: PdfDocument, page_number: int = 1) -> TextLayer:
+        return cls(document.words(page_number))
+
+    def __bool__(self) -> bool:
+        return bool(self._words)
+
+    def read(self, rect: Rect) -> OcrResult:
+        x, y, width, height = rect
+        inside = [
+            word
+            for word in self._words
+            if x <= (word[0] + word[2]) / 2 <= x + width
+            and y <= (word[1] + word[3]) / 2 <= y + height
+        ]
+        lines = _reading_order(_split_lines(inside))
+        texts = [" ".join(word[4] for word in line) for line in lines]
+        boxes = [_line_box(line, x, y) for line in lines]
+        return texts, boxes, [1.0] * len(texts)
+
+
+def _split_lines(words: list[tuple]) -> list[list[tuple]]:
+    # Uma linha do PDF pode atravessar colunas de tabela; quebra onde o
+    # espaco entre palavras passa da altura da linha, como faria o detector.
+    grouped: dict[tuple, list[tuple]] = {}
+    for word in words:
+        grouped.setdefault(word[5], []).append(word)
+    lines = []
+    for line_words in grouped.values():
+        line_words.sort(key=lambda word: word[0])
+        current = [line_words[0]]
+        for word in line_words[1:]:
+            previous = current[-1]
+            gap = word[0] - previous[2]
+            if gap > max(previous[3] - previous[1], word[3] - word[1]):
+                lines.append(current)
+                current = [word]
+            else:
+                current.append(word)
+        lines.append(current)
+    return lines
+
+
+def _reading_order(lines: list[list[tuple]]) -> list[list[tuple]]:
+    ordered = sorted(lines, key=lambda line: (line[0][1], line[0][0]))
+    for index in range(len(ordered) - 1):
+        for cursor in range(index, -1, -1):
+            current, following = ordered[cursor], ordered[cursor + 1]
+            if (
+                abs(following[0][1] - current[0][1]) < 10
+                and following[0][0] < current[0][0]
+            ):
+                ordered[cursor], ordered[cursor + 1] = following, current
+            else:
+                break
+    return ordered
+
+
+def _line_box(line: list[tuple], origin_x: int, origin_y: int) -> list[list[float]]:
+    x0 = min(word[0] for word in line) - origin_x
+    y0 = min(word[1] for word in line) - origin_y
+    x1 = max(word[2] for word in line) - origin_x
+    y1 = max(word[3] for word in line) - origin_y
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
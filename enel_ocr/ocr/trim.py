@@ -0,0 +1,77 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .engine import OcrResult
+
+# Diferenca minima (0-255, no canal que mais difere) do fundo para um pixel
+# contar como tinta e folga mantida em volta do conteudo para o detector.
+INK_THRESHOLD = 48
+MARGIN = 8
+
+Offset = Tuple[int, int]
+
+
+def trim_background(image: np.ndarray) -> tuple[np.ndarray, Offset] | None:
+    """
+    Corta as margens de fundo uniforme do recorte pelas projecoes de tinta
+    nas linhas e colunas. Devolve uma view do conteudo com MARGIN pixels de
+    folga e o deslocamento (x, y) dela no recorte, ou None quando o recorte
+    esta em branco.
+    """
+    height, width = image.shape[:2]
+    if height == 0 or width == 0:
+        return None
+    channels = image.shape[2] if image.ndim == 3 else 1
+    # (altura, largura * canais) e uma view do recorte, com linhas continuas:
+    # minimo e maximo por linha e por coluna sao reducoes rapidas em uint8,
+    # sem montar mascara por canal. Tinta e o byte (de qualquer canal) fora
+    # da faixa em volta do tom do fundo, tirado da mediana da borda.
+    flat = image.reshape(height, width * channels)
+    border = np.concatenate((flat[0], flat[-1], flat[:, 0], flat[:, -1]))
+    background = int(np.median(border))
+    low = max(background - INK_THRESHOLD, 0)
+    high = min(background + INK_THRESHOLD, 255)
+    rows = np.flatnonzero((flat.min(axis=1) < low) | (flat.max(axis=1) > high))
+    if rows.size == 0:
+        return None
+    columns = (flat.min(axis=0) < low) | (flat.max(axis=0) > high)
+    cols = np.flatnonzero(columns.reshape(width, channels).any(axis=1))
+    y0 = max(int(rows[0]) - MARGIN, 0)
+    y1 = min(int(rows[-1]) + 1 + MARGIN, height)
+    x0 = max(int(cols[0]) - MARGIN, 0)
+    x1 = min(int(cols[-1]) + 1 + MARGIN, width)
+    return image[y0:y1, x0:x1], (x0, y0)
+
+
+def trim_many(
+    images: Sequence[np.ndarray],
+) -> tuple[List[np.ndarray], List[int], List[Offset]]:
+    """
+    Aplica trim_background a cada imagem; devolve as imagens com conteudo,
+    os indices delas em images e os deslocamentos.
+    """
+    trimmed: list[np.ndarray] = []
+    indices: list[int] = []
+    offsets: list[Offset] = []
+    for index, image in enumerate(images):
+        found = trim_background(image)
+        if found is None:
+            continue
+        trimmed.append(found[0])
+        indices.append(index)
+        offsets.append(found[1])
+    return trimmed, indices, offsets
+
+
+def offset_result(result: OcrResult, offset: Offset) -> OcrResult:
+    dx, dy = offset
+    if not dx and not dy:
+        return result
+    texts, boxes, scores = result
+    moved = [[[point[0] + dx, point[1] + dy] for point in box] for box in boxes]
+    return texts, moved, scores
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-from .coords import build_regions
-from .detector import detect_layout
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Iterable, Iterator, Sequence
+
+import numpy as np
+
+from .coords import Coordinates
+from .detector import choose_layout, detection_regions
 from .mappers import amount_due as amount_due_mapper
 from .mappers import billing_period as billing_period_mapper
 from .mappers import classification_consumer_unit
@@ -22,39 +30,683 @@ from .mappers import tariff_flags
 from .mappers import credit_info as credit_info_mapper
 from .mappers import tax_info
 from .mappers import tax_items
+from .mappers._utils import OcrItems
 from .mappers import previous_reading as previous_reading_mapper
+from . import metrics
 from . import models
 from .models import Invoice
 from .ocr.crop import ImageCropper
-from .ocr.engine import run_ocr
-from .ocr.pdf import pdf_page_to_image_bytes
-
-
-def run_pipeline(pdf_bytes: bytes, ocr) -> Invoice:
-    image_bytes = pdf_page_to_image_bytes(pdf_bytes, page_number=1)
-    cropper = ImageCropper(image_bytes)
-    layout_id = detect_layout(ocr, cropper)
-    regions = build_regions(layout_id)
-
-    classification_result = ""
-    supply_type = ""
-    installation_number = ""
-    customer_number = ""
-    billing_period = ""
-    due_date = ""
-    amount_due = ""
-    current_reading = ""
-    previous_reading = ""
-    next_reading = ""
-    reading_days = 0
-    tax_info_result = None
-    invoice_items_result = []
-    meter_items_result = []
-    tax_items_result = []
-    customer_name = ""
-    customer_tax_number = ""
-    lighting_responsible = ""
-    important_message = ""
+from .ocr.engine import OcrResult, run_ocr_parallel
+from .ocr.page import assign_to_regions, build_bands, contains
+from .ocr.pdf import DEFAULT_DPI, PdfDocument
+from .ocr.text_layer import TextLayer
+from .ocr.trim import offset_result, trim_many
+from .recording import record_invoice
+from .registry import get_registry
+
+OCR_MODES = ("crop", "bands", "page")
+
+# Aumente quando uma mudanca fora do codigo do pacote (modelo do OCR,
+# dependencias) alterar o Invoice de uma mesma fatura: entra na chave do
+# cache de resultados da API.
+RESULT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class PipelineOptions:
+    ocr_mode: str = "crop"
+    text_layer: bool = False
+    trim: bool = False
+    grayscale: bool = False
+    # Diretorio onde gravar o OCR de cada fatura (enel_ocr.recording).
+    record_dir: str = ""
+
+    def __post_init__(self) -> None:
+        if self.ocr_mode not in OCR_MODES:
+            raise ValueError(f"ocr_mode invalido: {self.ocr_mode}")
+
+
+def _engines(ocr) -> list:
+    # ocr pode ser uma engine ou uma lista delas, usadas em paralelo no OCR
+    # das regioes; a deteccao de layout usa a primeira.
+    return list(ocr) if isinstance(ocr, (list, tuple)) else [ocr]
+
+
+def _rect(region: Coordinates) -> tuple[int, int, int, int]:
+    return (region.x, region.y, region.width, region.height)
+
+
+class _PageCropper:
+    """ImageCropper que so renderiza a pagina no primeiro recorte pedido."""
+
+    def __init__(
+        self, document: PdfDocument, page_number: int, clip, gray: bool = False
+    ) -> None:
+        self._document = document
+        self._page_number = page_number
+        self._clip = clip
+        self._gray = gray
+        self._cropper: ImageCropper | None = None
+
+    def _get(self) -> ImageCropper:
+        if self._cropper is None:
+            with metrics.timed("stage_seconds", "render", stage="render"):
+                raster = self._document.render(
+                    page_number=self._page_number, clip=self._clip, gray=self._gray
+                )
+            self._cropper = ImageCropper(raster.pixels, origin=(raster.x, raster.y))
+        return self._cropper
+
+    def prefetch(self) -> None:
+        self._get()
+
+    def crop_ndarray(self, coord) -> np.ndarray:
+        return self._get().crop_ndarray(coord)
+
+    def crop_many_ndarray(self, coords) -> list[np.ndarray]:
+        return self._get().crop_many_ndarray(coords)
+
+
+def _scale_boxes(result: OcrResult, factor: float) -> OcrResult:
+    texts, boxes, scores = result
+    scaled = [
+        [[point[0] * factor, point[1] * factor] for point in box] for box in boxes
+    ]
+    return texts, scaled, scores
+
+
+@dataclass
+class _InvoiceJob:
+    document: PdfDocument
+    use_text_layer: bool = False
+    grayscale: bool = False
+    layout_id: str = ""
+    regions: Sequence[Coordinates] = ()
+    results: list[OcrResult | None] = field(default_factory=list)
+    # OCR feito antes de saber o layout: regioes iguais em todos os layouts
+    # e os recortes de deteccao, cujas linhas servem as regioes dentro deles.
+    shared: dict[Coordinates, OcrResult] = field(default_factory=dict)
+    headers: dict[tuple, OcrResult] = field(default_factory=dict)
+    # Paginas renderizadas e camadas de texto, criadas no primeiro uso.
+    croppers: dict[int, _PageCropper] = field(default_factory=dict)
+    text_layers: dict[int, TextLayer] = field(default_factory=dict)
+
+    def has_page(self, page_number: int) -> bool:
+        return page_number <= self.document.page_count
+
+    def cropper(self, page_number: int = 1) -> _PageCropper:
+        cropper = self.croppers.get(page_number)
+        if cropper is None:
+            clip = get_registry().render_clips.get(page_number)
+            cropper = _PageCropper(self.document, page_number, clip, self.grayscale)
+            self.croppers[page_number] = cropper
+        return cropper
+
+    def text_layer(self, page_number: int = 1) -> TextLayer | None:
+        if not self.use_text_layer:
+            return None
+        text_layer = self.text_layers.get(page_number)
+        if text_layer is None:
+            text_layer = TextLayer.from_document(self.document, page_number)
+            self.text_layers[page_number] = text_layer
+        return text_layer
+
+    def pending(self) -> list[int]:
+        return [index for index, result in enumerate(self.results) if result is None]
+
+    def reset(self) -> None:
+        self.layout_id = ""
+        self.regions = ()
+        self.results = []
+        self.shared = {}
+        self.headers = {}
+
+
+def _open_job(document: PdfDocument, options: PipelineOptions) -> _InvoiceJob:
+    return _InvoiceJob(
+        document, use_text_layer=options.text_layer, grayscale=options.grayscale
+    )
+
+
+def _region_image(job: _InvoiceJob, region: Coordinates) -> np.ndarray:
+    rect = _rect(region)
+    if not region.dpi or region.dpi == DEFAULT_DPI:
+        return job.cropper(region.page).crop_ndarray(rect)
+    with metrics.timed("stage_seconds", "render", stage="render"):
+        return job.document.render(
+            page_number=region.page, dpi=region.dpi, clip=rect, gray=job.grayscale
+        ).pixels
+
+
+def _read_text_layer(job: _InvoiceJob, rect, page_number: int = 1) -> OcrResult | None:
+    text_layer = job.text_layer(page_number)
+    if not text_layer:
+        return None
+    result = text_layer.read(rect)
+    # Regioes sem texto na camada do PDF ficam pendentes para o OCR.
+    return result if result[0] else None
+
+
+def _page_result(job: _InvoiceJob, region: Coordinates) -> OcrResult | None:
+    # Regioes numa pagina que o PDF nao tem ficam vazias.
+    if not job.has_page(region.page):
+        return ([], [], [])
+    return _read_text_layer(job, _rect(region), region.page)
+
+
+def _run_ocr(
+    ocr,
+    images: list[np.ndarray],
+    single_line: list[bool] | None,
+    options: PipelineOptions,
+) -> list[OcrResult]:
+    metrics.increment("ocr_images_total", len(images))
+    if not options.trim:
+        return run_ocr_parallel(_engines(ocr), images, single_line=single_line)
+    # Recortes em branco nem vao para o OCR; os demais perdem as margens e
+    # as caixas voltam para as coordenadas do recorte inteiro.
+    trimmed, indices, offsets = trim_many(images)
+    metrics.increment("ocr_blank_images_total", len(images) - len(trimmed))
+    results: list[OcrResult] = [([], [], []) for _ in images]
+    if trimmed:
+        trimmed_single_line = None
+        if single_line is not None:
+            trimmed_single_line = [single_line[index] for index in indices]
+        found = run_ocr_parallel(
+            _engines(ocr), trimmed, single_line=trimmed_single_line
+        )
+        for index, offset, result in zip(indices, offsets, found):
+            results[index] = offset_result(result, offset)
+    return results
+
+
+def _ocr_before_layout(ocr, jobs: list[_InvoiceJob], options: PipelineOptions) -> None:
+    """
+    OCR feito antes de saber o layout. Os recortes de deteccao vao para o OCR
+    na ordem de headers.json, cada um so nas faturas que ainda nao tem layout
+    com score confiante (a maioria para no primeiro); a primeira chamada leva
+    junto, no modo crop, as regioes iguais em todos os layouts.
+    """
+    detection_rects = detection_regions()
+    shared_regions = ()
+    if options.ocr_mode == "crop":
+        shared_regions = get_registry().shared_regions
+    header_texts: dict[int, dict[tuple, list[str]]] = {}
+    shared = []
+    for job in jobs:
+        texts = header_texts[id(job)] = {}
+        for rect, _single_line in detection_rects:
+            result = _read_text_layer(job, rect)
+            if result:
+                texts[rect] = result[0]
+        job.layout_id = choose_layout(texts, final=False) or ""
+        for region in shared_regions:
+            if not job.has_page(region.page):
+                job.shared[region] = ([], [], [])
+                continue
+            result = _read_text_layer(job, _rect(region), region.page)
+            if result:
+                job.shared[region] = result
+            else:
+                shared.append((job, region))
+    shared.sort(key=lambda item: item[1].description)
+
+    for rect, header_single_line in detection_rects or [(None, False)]:
+        headers = [
+            job
+            for job in jobs
+            if rect and not job.layout_id and rect not in header_texts[id(job)]
+        ]
+        images = [job.cropper().crop_ndarray(rect) for job in headers]
+        images.extend(_region_image(job, region) for job, region in shared)
+        single_line = [header_single_line] * len(headers)
+        single_line.extend(region.single_line for _job, region in shared)
+        results = []
+        if images:
+            results = _run_ocr(ocr, images, single_line, options)
+        for job, result in zip(headers, results):
+            job.headers[rect] = result
+            texts = header_texts[id(job)]
+            texts[rect] = result[0]
+            job.layout_id = choose_layout(texts, final=False) or ""
+        for (job, region), result in zip(shared, results[len(headers) :]):
+            if region.dpi and region.dpi != DEFAULT_DPI:
+                result = _scale_boxes(result, DEFAULT_DPI / region.dpi)
+            job.shared[region] = result
+        shared = []
+    for job in jobs:
+        if not job.layout_id:
+            job.layout_id = choose_layout(header_texts[id(job)])
+
+
+def _apply_layout(job: _InvoiceJob, options: PipelineOptions) -> None:
+    job.regions = get_registry().regions(job.layout_id)
+    job.results = [
+        job.shared.get(region) or _page_result(job, region) for region in job.regions
+    ]
+    if options.ocr_mode == "crop":
+        # No modo crop cada regiao tem o proprio recorte (e single_line): as
+        # linhas do cabecalho, divididas por sobreposicao, mudariam o texto.
+        return
+    for rect, header in job.headers.items():
+        inside = [
+            index
+            for index in job.pending()
+            if not job.regions[index].dpi
+            and job.regions[index].page == 1
+            and contains(rect, _rect(job.regions[index]))
+        ]
+        rects = [_rect(job.regions[index]) for index in inside]
+        for index, result in zip(inside, assign_to_regions([rect], [header], rects)):
+            job.results[index] = result
+
+
+def _ocr_jobs(ocr, jobs: list[_InvoiceJob], options: PipelineOptions) -> None:
+    """
+    Preenche as regioes pendentes de todas as faturas com uma unica chamada
+    de OCR; no modo crop, regioes do mesmo tipo ficam juntas no lote.
+    """
+    if options.ocr_mode == "crop":
+        pending = [(job, index) for job in jobs for index in job.pending()]
+        pending.sort(key=lambda item: item[0].regions[item[1]].description)
+        regions = [job.regions[index] for job, index in pending]
+        images = [
+            _region_image(job, job.regions[index]) for job, index in pending
+        ]
+        single_line = [region.single_line for region in regions]
+        results = []
+        if images:
+            results = _run_ocr(ocr, images, single_line, options)
+        for (job, index), region, result in zip(pending, regions, results):
+            # Regioes renderizadas em outro DPI voltam para a escala do layout.
+            if region.dpi and region.dpi != DEFAULT_DPI:
+                result = _scale_boxes(result, DEFAULT_DPI / region.dpi)
+            job.results[index] = result
+        return
+
+    planned = []
+    images = []
+    for job in jobs:
+        by_page: dict[int, list[int]] = {}
+        for index in job.pending():
+            by_page.setdefault(job.regions[index].page, []).append(index)
+        for page_number, indices in sorted(by_page.items()):
+            rects = [_rect(job.regions[index]) for index in indices]
+            bands = build_bands(rects, merge_all=options.ocr_mode == "page")
+            planned.append((job, indices, rects, bands))
+            images.extend(job.cropper(page_number).crop_many_ndarray(bands))
+    band_results = _run_ocr(ocr, images, None, options) if images else []
+    offset = 0
+    for job, indices, rects, bands in planned:
+        assigned = assign_to_regions(
+            bands, band_results[offset : offset + len(bands)], rects
+        )
+        offset += len(bands)
+        for index, result in zip(indices, assigned):
+            job.results[index] = result
+
+
+def _recognize_jobs(ocr, jobs: list[_InvoiceJob], options: PipelineOptions) -> None:
+    with metrics.timed("stage_seconds", "layout", stage="layout"):
+        _ocr_before_layout(ocr, jobs, options)
+        for job in jobs:
+            _apply_layout(job, options)
+    with metrics.timed("stage_seconds", "ocr", stage="ocr"):
+        _ocr_jobs(ocr, jobs, options)
+
+
+def run_pipeline_batch(
+    pdfs: Sequence[bytes], ocr, options: PipelineOptions | None = None
+) -> list[Invoice]:
+    options = options or PipelineOptions()
+    with ExitStack() as stack:
+        jobs = [
+            _open_job(stack.enter_context(PdfDocument(pdf_bytes)), options)
+            for pdf_bytes in pdfs
+        ]
+        if not options.text_layer:
+            # Renderiza antes para o tempo de render nao entrar no de layout.
+            for job in jobs:
+                job.cropper().prefetch()
+        _recognize_jobs(ocr, jobs, options)
+    return [_finish_job(job, options) for job in jobs]
+
+
+def _finish_job(job: _InvoiceJob, options: PipelineOptions) -> Invoice:
+    invoice = _build_invoice(job.layout_id, job.regions, job.results)
+    if options.record_dir:
+        record_invoice(
+            options.record_dir, job.layout_id, job.regions, job.results, invoice
+        )
+    return invoice
+
+
+def run_pipeline(
+    pdf_bytes: bytes, ocr, options: PipelineOptions | None = None
+) -> Invoice:
+    return run_pipeline_batch([pdf_bytes], ocr, options)[0]
+
+
+_DONE = object()
+
+
+class _StageError:
+    """Falha fora de um PDF especifico (ex.: ao iterar a entrada)."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def _put(queue: Queue, item, stop: Event) -> bool:
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _get(queue: Queue, stop: Event):
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            continue
+    return _DONE
+
+
+def _close_job(item) -> None:
+    if isinstance(item, _InvoiceJob):
+        item.document.close()
+
+
+def _render_stage(
+    pdfs: Iterable[bytes], options: PipelineOptions, outbox: Queue, stop: Event
+) -> None:
+    try:
+        for pdf_bytes in pdfs:
+            try:
+                item = _open_job(PdfDocument(pdf_bytes), options)
+                if not options.text_layer:
+                    # Com a camada de texto a pagina pode nem ser renderizada.
+                    item.cropper().prefetch()
+            except Exception as exc:
+                item = exc
+            if not _put(outbox, item, stop):
+                _close_job(item)
+                return
+    except Exception as exc:
+        _put(outbox, _StageError(exc), stop)
+    finally:
+        _put(outbox, _DONE, stop)
+
+
+def _recognize(
+    ocr, jobs: list[_InvoiceJob], options: PipelineOptions
+) -> dict[int, Exception]:
+    failures: dict[int, Exception] = {}
+    try:
+        _recognize_jobs(ocr, jobs, options)
+    except Exception:
+        # Isola a fatura que falhou refazendo o lote uma a uma.
+        for job in jobs:
+            job.reset()
+            try:
+                _recognize_jobs(ocr, [job], options)
+            except Exception as exc:
+                failures[id(job)] = exc
+    return failures
+
+
+def _ocr_stage(
+    ocr,
+    options: PipelineOptions,
+    max_batch: int,
+    inbox: Queue,
+    outbox: Queue,
+    stop: Event,
+) -> None:
+    finished = False
+    try:
+        while not finished:
+            batch = [_get(inbox, stop)]
+            while len(batch) < max_batch and batch[-1] is not _DONE:
+                try:
+                    batch.append(inbox.get_nowait())
+                except Empty:
+                    break
+            jobs = [item for item in batch if isinstance(item, _InvoiceJob)]
+            try:
+                failures = _recognize(ocr, jobs, options)
+            finally:
+                for job in jobs:
+                    job.document.close()
+                    # As paginas renderizadas (~19 MB cada) nao servem mais:
+                    # o mapeamento so le os resultados do OCR.
+                    job.croppers.clear()
+            for item in batch:
+                if item is _DONE:
+                    finished = True
+                    break
+                if isinstance(item, _InvoiceJob):
+                    item = failures.get(id(item), item)
+                if not _put(outbox, item, stop):
+                    return
+    except Exception as exc:
+        _put(outbox, _StageError(exc), stop)
+    finally:
+        _put(outbox, _DONE, stop)
+        while True:
+            try:
+                _close_job(inbox.get_nowait())
+            except Empty:
+                break
+
+
+def run_pipeline_stream(
+    pdfs: Iterable[bytes],
+    ocr,
+    options: PipelineOptions | None = None,
+    max_batch: int = 8,
+    queue_size: int = 2,
+    return_exceptions: bool = False,
+) -> Iterator[Invoice | Exception]:
+    """
+    Processa os PDFs em estagios ligados por filas limitadas: uma thread abre
+    e renderiza, outra detecta o layout e roda o OCR (em lote com ate
+    max_batch faturas ja renderizadas) e o mapeamento roda em quem consome o
+    iterador. Os Invoices saem na ordem de entrada; com return_exceptions, a
+    falha de um PDF vem no lugar do seu Invoice em vez de interromper.
+    """
+    options = options or PipelineOptions()
+    max_batch = max(max_batch, 1)
+    # A fila de renderizadas comporta um lote inteiro: com menos, o OCR nunca
+    # juntaria mais que queue_size + 1 faturas por chamada.
+    rendered: Queue = Queue(maxsize=max(queue_size, max_batch))
+    recognized: Queue = Queue(maxsize=queue_size)
+    stop = Event()
+    threads = [
+        Thread(
+            target=_render_stage,
+            args=(pdfs, options, rendered, stop),
+            name="pipeline-render",
+            daemon=True,
+        ),
+        Thread(
+            target=_ocr_stage,
+            args=(ocr, options, max_batch, rendered, recognized, stop),
+            name="pipeline-ocr",
+            daemon=True,
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = recognized.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            if isinstance(item, _InvoiceJob):
+                try:
+                    item = _finish_job(item, options)
+                except Exception as exc:
+                    item = exc
+            if isinstance(item, Exception) and not return_exceptions:
+                raise item
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        while True:
+            try:
+                _close_job(rendered.get_nowait())
+            except Empty:
+                break
+
+
+@dataclass
+class _InvoiceFields:
+    layout_id: str
+    classification_result: str = ""
+    supply_type: str = ""
+    installation_number: str = ""
+    customer_number: str = ""
+    billing_period: str = ""
+    due_date: str = ""
+    amount_due: str = ""
+    current_reading: str = ""
+    previous_reading: str = ""
+    next_reading: str = ""
+    reading_days: int = 0
+    tax_info_result: tax_info.TaxInfo | None = None
+    invoice_items_result: list = field(default_factory=list)
+    meter_items_result: list = field(default_factory=list)
+    tax_items_result: list = field(default_factory=list)
+    customer_name: str = ""
+    customer_tax_number: str = ""
+    lighting_responsible: str = ""
+    important_message: str = ""
+
+
+def _handle_descricao_faturamento(fields: _InvoiceFields, texts, boxes) -> None:
+    # Itens e medidores leem a mesma tabela: caixas e linhas saem uma vez so.
+    items = OcrItems(texts, boxes)
+    fields.invoice_items_result = invoice_items.map_items(items)
+    fields.meter_items_result = meter_items.map_items(items)
+
+
+def _handle_tributos(fields: _InvoiceFields, texts, boxes) -> None:
+    fields.tax_items_result = tax_items.map(texts, boxes)
+
+
+def _handle_classificacao_unidade(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.classification_result = classification_consumer_unit.map(texts)
+
+
+def _handle_tipo_fornecimento(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.supply_type = supply_type_mapper.map(texts)
+
+
+def _handle_numero_instalacao(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.installation_number = installation_number_mapper.map(
+        texts, layout_id=fields.layout_id
+    )
+
+
+def _handle_numero_cliente(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.customer_number = customer_number_mapper.map(
+        texts, layout_id=fields.layout_id
+    )
+
+
+def _handle_periodo_faturamento(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.billing_period = billing_period_mapper.map(texts)
+
+
+def _handle_data_vencimento(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.due_date = due_date_mapper.map(texts)
+
+
+def _handle_valor_pagar(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.amount_due = amount_due_mapper.map(texts)
+
+
+def _handle_leitura_atual(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.current_reading = current_reading_mapper.map(texts)
+
+
+def _handle_leitura_anterior(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.previous_reading = previous_reading_mapper.map(texts)
+
+
+def _handle_proxima_leitura(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.next_reading = next_reading_mapper.map(texts)
+
+
+def _handle_dias_leitura(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.reading_days = reading_days_mapper.map(texts)
+
+
+def _handle_dados_pessoais(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.customer_name, fields.customer_tax_number = personal_data_mapper.map(texts)
+
+
+def _handle_responsavel_iluminacao(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.lighting_responsible = lighting_responsible_mapper.map(texts)
+
+
+def _handle_informacoes_tributarias(fields: _InvoiceFields, texts, boxes) -> None:
+    fields.tax_info_result = tax_info.map(texts, boxes)
+
+
+def _handle_mensagem_importante(fields: _InvoiceFields, texts, _boxes) -> None:
+    fields.important_message = important_message_mapper.map(texts)
+
+
+_HANDLERS = {
+    "DESCRICAO_FATURAMENTO": _handle_descricao_faturamento,
+    "TRIBUTOS": _handle_tributos,
+    "CLASSIFICACAO_UNIDADE_CONSUMIDORA": _handle_classificacao_unidade,
+    "TIPO_FORNECIMENTO": _handle_tipo_fornecimento,
+    "NUMERO_INSTALACAO": _handle_numero_instalacao,
+    "NUMERO_CLIENTE": _handle_numero_cliente,
+    "PERIODO_FATURAMENTO": _handle_periodo_faturamento,
+    "DATA_VENCIMENTO": _handle_data_vencimento,
+    "VALOR_PAGAR": _handle_valor_pagar,
+    "LEITURA_ATUAL": _handle_leitura_atual,
+    "LEITURA_ANTERIOR": _handle_leitura_anterior,
+    "PROXIMA_LEITURA": _handle_proxima_leitura,
+    "DIAS_LEITURA": _handle_dias_leitura,
+    "DADOS_PESSOAIS": _handle_dados_pessoais,
+    "RESPONSAVEL_PELA_ILUMINACAO": _handle_responsavel_iluminacao,
+    "INFORMACOES_TRIBUTARIAS": _handle_informacoes_tributarias,
+    "MENSAGEM_IMPORTANTE": _handle_mensagem_importante,
+}
+
+
+def _build_invoice(
+    layout_id: str, regions: Sequence[Coordinates], results: list[OcrResult]
+) -> Invoice:
+    with metrics.timed("stage_seconds", "map", stage="map"):
+        return _map_invoice(layout_id, regions, results)
+
+
+def _map_invoice(
+    layout_id: str, regions: Sequence[Coordinates], results: list[OcrResult]
+) -> Invoice:
+    fields = _InvoiceFields(layout_id)
+    for region, (texts, boxes, _scores) in zip(regions, results):
+        handler = _HANDLERS.get(region.description)
+        if not handler:
+            continue
+        with metrics.timed("region_seconds", region=region.description):
+            handler(fields, texts, boxes)
+
+    important_message = fields.important_message
     tariff_flag_periods = []
     credit_info = models.CreditInfo(
         injected_hfp_kwh=0.0,
@@ -63,109 +715,11 @@ def run_pipeline(pdf_bytes: bytes, ocr) -> Invoice:
         expiring_kwh=0.0,
     )
 
-    def _handle_descricao_faturamento(texts, boxes) -> None:
-        nonlocal invoice_items_result, meter_items_result
-        invoice_items_result = invoice_items.map(texts, boxes)
-        meter_items_result = meter_items.map(texts, boxes)
-
-    def _handle_tributos(texts, boxes) -> None:
-        nonlocal tax_items_result
-        tax_items_result = tax_items.map(texts, boxes)
-
-    def _handle_classificacao_unidade(texts, _boxes) -> None:
-        nonlocal classification_result
-        classification_result = classification_consumer_unit.map(texts)
-
-    def _handle_tipo_fornecimento(texts, _boxes) -> None:
-        nonlocal supply_type
-        supply_type = supply_type_mapper.map(texts)
-
-    def _handle_numero_instalacao(texts, _boxes) -> None:
-        nonlocal installation_number
-        installation_number = installation_number_mapper.map(texts, layout_id=layout_id)
-
-    def _handle_numero_cliente(texts, _boxes) -> None:
-        nonlocal customer_number
-        customer_number = customer_number_mapper.map(texts, layout_id=layout_id)
-
-    def _handle_periodo_faturamento(texts, _boxes) -> None:
-        nonlocal billing_period
-        billing_period = billing_period_mapper.map(texts)
-
-    def _handle_data_vencimento(texts, _boxes) -> None:
-        nonlocal due_date
-        due_date = due_date_mapper.map(texts)
-
-    def _handle_valor_pagar(texts, _boxes) -> None:
-        nonlocal amount_due
-        amount_due = amount_due_mapper.map(texts)
-
-    def _handle_leitura_atual(texts, _boxes) -> None:
-        nonlocal current_reading
-        current_reading = current_reading_mapper.map(texts)
-
-    def _handle_leitura_anterior(texts, _boxes) -> None:
-        nonlocal previous_reading
-        previous_reading = previous_reading_mapper.map(texts)
-
-    def _handle_proxima_leitura(texts, _boxes) -> None:
-        nonlocal next_reading
-        next_reading = next_reading_mapper.map(texts)
-
-    def _handle_dias_leitura(texts, _boxes) -> None:
-        nonlocal reading_days
-        reading_days = reading_days_mapper.map(texts)
-
-    def _handle_dados_pessoais(texts, _boxes) -> None:
-        nonlocal customer_name, customer_tax_number
-        customer_name, customer_tax_number = personal_data_mapper.map(texts)
-
-    def _handle_responsavel_iluminacao(texts, _boxes) -> None:
-        nonlocal lighting_responsible
-        lighting_responsible = lighting_responsible_mapper.map(texts)
-
-    def _handle_informacoes_tributarias(texts, boxes) -> None:
-        nonlocal tax_info_result
-        tax_info_result = tax_info.map(texts, boxes)
-
-    def _handle_mensagem_importante(texts, _boxes) -> None:
-        nonlocal important_message
-        important_message = important_message_mapper.map(texts)
-
-    handlers = {
-        "DESCRICAO_FATURAMENTO": _handle_descricao_faturamento,
-        "TRIBUTOS": _handle_tributos,
-        "CLASSIFICACAO_UNIDADE_CONSUMIDORA": _handle_classificacao_unidade,
-        "TIPO_FORNECIMENTO": _handle_tipo_fornecimento,
-        "NUMERO_INSTALACAO": _handle_numero_instalacao,
-        "NUMERO_CLIENTE": _handle_numero_cliente,
-        "PERIODO_FATURAMENTO": _handle_periodo_faturamento,
-        "DATA_VENCIMENTO": _handle_data_vencimento,
-        "VALOR_PAGAR": _handle_valor_pagar,
-        "LEITURA_ATUAL": _handle_leitura_atual,
-        "LEITURA_ANTERIOR": _handle_leitura_anterior,
-        "PROXIMA_LEITURA": _handle_proxima_leitura,
-        "DIAS_LEITURA": _handle_dias_leitura,
-        "DADOS_PESSOAIS": _handle_dados_pessoais,
-        "RESPONSAVEL_PELA_ILUMINACAO": _handle_responsavel_iluminacao,
-        "INFORMACOES_TRIBUTARIAS": _handle_informacoes_tributarias,
-        "MENSAGEM_IMPORTANTE": _handle_mensagem_importante,
-    }
-
-    for region in regions:
-        handler = handlers.get(region.description)
-        if not handler:
-            continue
-        coords = (region.x, region.y, region.width, region.height)
-        image_np = cropper.crop_ndarray(coords)
-        texts, boxes, _scores = run_ocr(ocr, image_np)
-        handler(texts, boxes)
-
     if important_message:
         tariff_flag_periods = tariff_flags.map(important_message)
         credit_info = credit_info_mapper.map(important_message)
 
-    base_tax_info = tax_info_result or tax_info.TaxInfo(
+    base_tax_info = fields.tax_info_result or tax_info.TaxInfo(
         invoice_number="",
         invoice_issue_date="",
         access_key="",
@@ -173,33 +727,33 @@ def run_pipeline(pdf_bytes: bytes, ocr) -> Invoice:
         presentation_date="",
         tax_items=[],
     )
-    if tax_items_result:
+    if fields.tax_items_result:
         base_tax_info = tax_info.TaxInfo(
             invoice_number=base_tax_info.invoice_number,
             invoice_issue_date=base_tax_info.invoice_issue_date,
             access_key=base_tax_info.access_key,
             cfop=base_tax_info.cfop,
             presentation_date=base_tax_info.presentation_date,
-            tax_items=tax_items_result,
+            tax_items=fields.tax_items_result,
         )
     return Invoice(
-        invoice_items=invoice_items_result,
-        meter_items=meter_items_result,
-        classification_consumer_unit=classification_result,
-        supply_type=supply_type,
-        installation_number=installation_number,
-        customer_number=customer_number,
-        customer_name=customer_name,
-        tax_number=customer_tax_number,
-        lighting_responsible=lighting_responsible,
-        billing_period=billing_period,
-        due_date=due_date,
-        amount_due=amount_due,
+        invoice_items=fields.invoice_items_result,
+        meter_items=fields.meter_items_result,
+        classification_consumer_unit=fields.classification_result,
+        supply_type=fields.supply_type,
+        installation_number=fields.installation_number,
+        customer_number=fields.customer_number,
+        customer_name=fields.customer_name,
+        tax_number=fields.customer_tax_number,
+        lighting_responsible=fields.lighting_responsible,
+        billing_period=fields.billing_period,
+        due_date=fields.due_date,
+        amount_due=fields.amount_due,
         reading_dates=models.ReadingDates(
-            previous_reading=previous_reading,
-            current_reading=current_reading,
-            reading_days=reading_days,
-            next_reading=next_reading,
+            previous_reading=fields.previous_reading,
+            current_reading=fields.current_reading,
+            reading_days=fields.reading_days,
+            next_reading=fields.next_reading,
         ),
         tax_info=base_tax_info,
         important_message=important_message,
@@ -0,0 +1,85 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Sequence
+
+from .coords import Coordinates
+from .models import Invoice
+from .ocr.engine import OcrResult
+from .serialization import invoice_to_dict
+
+
+@dataclass(frozen=True)
+class Fixture:
+    """Saida do OCR de cada regiao de uma fatura e o Invoice mapeado dela."""
+
+    path: Path
+    layout_id: str
+    regions: List[Coordinates]
+    results: List[OcrResult]
+    invoice: dict
+
+
+def record_invoice(
+    directory: str | Path,
+    layout_id: str,
+    regions: Sequence[Coordinates],
+    results: Sequence[OcrResult],
+    invoice: Invoice,
+) -> Path:
+    """
+    Grava a fixture em directory/<hash>.json. O nome vem do conteudo do OCR,
+    entao a mesma fatura gravada de novo sobrescreve o mesmo arquivo.
+    """
+    entries = [
+        {
+            "region": asdict(region),
+            "texts": list(texts),
+            "boxes": [[[float(x), float(y)] for x, y in box] for box in boxes],
+            "scores": [float(score) for score in scores],
+        }
+        for region, (texts, boxes, scores) in zip(regions, results)
+    ]
+    content = json.dumps(
+        {"layout_id": layout_id, "regions": entries}, ensure_ascii=False, sort_keys=True
+    )
+    name = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    payload = {
+        "layout_id": layout_id,
+        "regions": entries,
+        "invoice": invoice_to_dict(invoice),
+    }
+    path = Path(directory) / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def load_fixture(path: str | Path) -> Fixture:
+    path = Path(path)
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    regions = []
+    results: list[OcrResult] = []
+    for entry in payload["regions"]:
+        regions.append(Coordinates(**entry["region"]))
+        results.append((entry["texts"], entry["boxes"], entry["scores"]))
+    return Fixture(
+        path=path,
+        layout_id=payload["layout_id"],
+        regions=regions,
+        results=results,
+        invoice=payload.get("invoice", {}),
+    )
+
+
+def iter_fixtures(paths: Iterable[str | Path]) -> Iterator[Fixture]:
+    """Fixtures dos arquivos .json informados ou dentro dos diretorios."""
+    for raw in paths:
+        path = Path(raw)
+        files = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+        for item in files:
+            yield load_fixture(item)
@@ -0,0 +1,202 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import hashlib
+import json
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Tuple
+
+from .coords import Coordinates
+from .ocr.page import union_rect
+
+Rect = Tuple[int, int, int, int]
+
+LAYOUTS_DIR = Path(__file__).resolve().parent / "layouts"
+
+
+def normalize_text(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    without_accents = "".join(
+        char for char in normalized if not unicodedata.combining(char)
+    )
+    return " ".join(without_accents.upper().split())
+
+
+def _parse_region(region: dict) -> Rect | None:
+    try:
+        x = int(float(region["x"]))
+        y = int(float(region["y"]))
+        w = int(float(region["w"]))
+        h = int(float(region["h"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if w <= 0 or h <= 0:
+        return None
+
+    return (x, y, w, h)
+
+
+@dataclass(frozen=True)
+class HeaderRule:
+    layout_id: str
+    anchors: Tuple[str, ...]
+    region: Rect | None
+    # Recorte de uma linha so: vai direto para o reconhecimento.
+    single_line: bool = False
+
+
+@dataclass(frozen=True)
+class LayoutRegistry:
+    """
+    Layouts e regras de cabecalho lidos e validados uma vez: regioes como
+    tuplas imutaveis, ancoras ja normalizadas, o recorte de cada pagina que
+    cobre as regioes dela (os cabecalhos ficam na pagina 1), as regioes
+    iguais em todos os layouts (que podem ir para o OCR antes de o layout
+    ser detectado), o layout usado quando nenhum cabecalho bate
+    ("fallback": true em headers.json) e o hash dos JSONs lidos.
+    """
+
+    layouts: Dict[str, Tuple[Coordinates, ...]]
+    headers: Tuple[HeaderRule, ...]
+    render_clips: Dict[int, Rect]
+    shared_regions: Tuple[Coordinates, ...] = ()
+    fallback_layout: str = "v1"
+    fingerprint: str = ""
+
+    def regions(self, layout_id: str) -> Tuple[Coordinates, ...]:
+        try:
+            return self.layouts[layout_id]
+        except KeyError:
+            raise ValueError(f"layout desconhecido: {layout_id}") from None
+
+    def header(self, layout_id: str) -> HeaderRule | None:
+        for rule in self.headers:
+            if rule.layout_id == layout_id:
+                return rule
+        return None
+
+
+def _load_coordinates(layout_id: str, index: int, region: dict) -> Coordinates:
+    where = f"layout {layout_id}, regiao {index}"
+    description = region.get("description")
+    if not isinstance(description, str) or not description:
+        raise ValueError(f"{where}: description ausente")
+    try:
+        x, y, width, height = (
+            int(region[key]) for key in ("x", "y", "width", "height")
+        )
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{where} ({description}): x, y, width e height") from None
+    if x < 0 or y < 0 or width <= 0 or height <= 0:
+        raise ValueError(f"{where} ({description}): retangulo invalido")
+    dpi = region.get("dpi")
+    if dpi is not None and (not isinstance(dpi, int) or dpi <= 0):
+        raise ValueError(f"{where} ({description}): dpi invalido")
+    page = region.get("page", 1)
+    if not isinstance(page, int) or page < 1:
+        raise ValueError(f"{where} ({description}): page invalida")
+    return Coordinates(
+        description=description,
+        x=x,
+        y=y,
+        width=width,
+        height=height,
+        single_line=bool(region.get("single_line", False)),
+        dpi=dpi,
+        page=page,
+    )
+
+
+def load_registry(layouts_dir: Path = LAYOUTS_DIR) -> LayoutRegistry:
+    layouts: dict[str, Tuple[Coordinates, ...]] = {}
+    digest = hashlib.sha256()
+
+    def read_json(path: Path):
+        data = path.read_bytes()
+        digest.update(path.name.encode("utf-8"))
+        digest.update(data)
+        return json.loads(data)
+
+    for path in sorted(layouts_dir.glob("*.json")):
+        if path.stem == "headers":
+            continue
+        payload = read_json(path)
+        regions = tuple(
+            _load_coordinates(path.stem, index, region)
+            for index, region in enumerate(payload.get("regions", []))
+        )
+        descriptions = [region.description for region in regions]
+        if len(set(descriptions)) != len(descriptions):
+            raise ValueError(f"layout {path.stem}: description repetida")
+        layouts[path.stem] = regions
+
+    headers: list[HeaderRule] = []
+    fallbacks: list[str] = []
+    headers_path = layouts_dir / "headers.json"
+    if headers_path.exists():
+        payload = read_json(headers_path)
+        for layout_id, rules in payload.items():
+            if layout_id not in layouts:
+                raise ValueError(f"headers.json: layout desconhecido: {layout_id}")
+            if rules.get("fallback"):
+                fallbacks.append(layout_id)
+            anchors = tuple(
+                normalize_text(str(anchor)) for anchor in rules.get("anchors", [])
+            )
+            region = _parse_region(rules.get("region", {}))
+            single_line = bool(rules.get("single_line", False))
+            headers.append(HeaderRule(layout_id, anchors, region, single_line))
+
+    rects: dict[int, list[Rect]] = {}
+    rects[1] = [rule.region for rule in headers if rule.region]
+    for regions in layouts.values():
+        for r in regions:
+            rects.setdefault(r.page, []).append((r.x, r.y, r.width, r.height))
+    render_clips = {page: union_rect(items) for page, items in rects.items() if items}
+    all_regions = list(layouts.values())
+    shared = tuple(
+        region
+        for region in (all_regions[0] if all_regions else ())
+        if all(region in regions for regions in all_regions[1:])
+    )
+    if len(fallbacks) > 1:
+        raise ValueError("headers.json: mais de um layout com fallback")
+    if fallbacks:
+        fallback = fallbacks[0]
+    else:
+        fallback = "v1" if "v1" in layouts or not layouts else next(iter(layouts))
+    return LayoutRegistry(
+        layouts,
+        tuple(headers),
+        render_clips,
+        shared,
+        fallback,
+        digest.hexdigest(),
+    )
+
+
+_REGISTRY: LayoutRegistry | None = None
+_REGISTRY_LOCK = Lock()
+
+
+def get_registry() -> LayoutRegistry:
+    if _REGISTRY is None:
+        with _REGISTRY_LOCK:
+            if _REGISTRY is None:
+                return reload_layouts()
+    return _REGISTRY
+
+
+def reload_layouts() -> LayoutRegistry:
+    """
+    Rele os JSONs de layouts/; chame depois de alterar os arquivos. Em caso
+    de erro de validacao o registro anterior continua valendo.
+    """
+    global _REGISTRY
+    registry = load_registry()
+    _REGISTRY = registry
+    return registry
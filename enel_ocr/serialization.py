@@ -0,0 +1,21 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+from dataclasses import asdict
+from decimal import Decimal
+
+from .models import Invoice
+
+
+def invoice_to_dict(invoice: Invoice) -> dict:
+    return serialize_decimals(asdict(invoice))
+
+
+def serialize_decimals(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, list):
+        return [serialize_decimals(item) for item in value]
+    if isinstance(value, dict):
+        return {key: serialize_decimals(item) for key, item in value.items()}
+    return value
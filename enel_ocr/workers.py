@@ -0,0 +1,142 @@
+# -*- coding: ascii -*-
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import get_context
+from threading import BoundedSemaphore
+from typing import TYPE_CHECKING
+
+from . import metrics
+from .ocr.pool import OcrPoolTimeout
+
+if TYPE_CHECKING:
+    from .cache import CacheConfig
+    from .models import Invoice
+    from .pipeline import PipelineOptions
+
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+_WORKER_OCR = None
+_WORKER_OPTIONS = None
+
+
+def _init_worker(
+    cpu_threads: int | None,
+    options: dict | None,
+    engines: int,
+    ocr_cache: CacheConfig | None,
+) -> None:
+    global _WORKER_OCR, _WORKER_OPTIONS
+    # Os limites de threads valem so para este processo e precisam vir antes
+    # de numpy, fitz e Paddle dimensionarem seus pools: por isso o pipeline
+    # so e importado aqui e as opcoes chegam como dict (o pickle de um
+    # PipelineOptions importaria o pipeline antes do initializer).
+    if cpu_threads:
+        for name in _THREAD_ENV_VARS:
+            os.environ[name] = str(cpu_threads)
+    from .ocr.engine import init_ocr
+    from .pipeline import PipelineOptions
+
+    # As engines do processo dividem o mesmo cache.
+    cache = ocr_cache.create() if ocr_cache else None
+    if engines > 1:
+        _WORKER_OCR = [
+            init_ocr(cpu_threads=cpu_threads, cache=cache) for _ in range(engines)
+        ]
+    else:
+        _WORKER_OCR = init_ocr(cpu_threads=cpu_threads, cache=cache)
+    _WORKER_OPTIONS = PipelineOptions(**options) if options is not None else None
+
+
+def _process(pdf_bytes: bytes) -> Invoice:
+    from .pipeline import run_pipeline
+
+    return run_pipeline(pdf_bytes, _WORKER_OCR, _WORKER_OPTIONS)
+
+
+def _process_batch(pdfs: list[bytes]) -> list[Invoice | Exception]:
+    from .pipeline import run_pipeline_stream
+
+    stream = run_pipeline_stream(
+        pdfs, _WORKER_OCR, _WORKER_OPTIONS, return_exceptions=True
+    )
+    return list(stream)
+
+
+def _noop() -> None:
+    return None
+
+
+class OcrWorkerPool:
+    """
+    Processos dedicados ao OCR, cada um com sua engine carregada uma vez no
+    inicio. submit enfileira um PDF e devolve um Future com o Invoice
+    (submit_batch, uma lista de PDFs pelo pipeline em estagios, com a falha
+    de cada PDF no lugar do seu Invoice); com
+    max_pending jobs na fila, espera ate timeout segundos por uma vaga e
+    levanta OcrPoolTimeout. Com engines maior que 1, cada processo carrega
+    essa quantidade de engines e divide entre elas o OCR das regioes.
+    ocr_cache liga o cache da saida do OCR (CachedOcr) em cada processo.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        cpu_threads: int | None = None,
+        options: PipelineOptions | None = None,
+        max_pending: int | None = None,
+        engines: int = 1,
+        ocr_cache: CacheConfig | None = None,
+    ) -> None:
+        if processes < 1:
+            raise ValueError("processes deve ser 1 ou maior")
+        self._processes = processes
+        self._slots = BoundedSemaphore(max_pending or processes * 4)
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                cpu_threads,
+                asdict(options) if options is not None else None,
+                engines,
+                ocr_cache,
+            ),
+        )
+
+    def warm_up(self) -> None:
+        """Sobe todos os processos, que carregam o modelo ao nascer."""
+        for future in [self._executor.submit(_noop) for _ in range(self._processes)]:
+            future.result()
+
+    def submit(self, pdf_bytes: bytes, timeout: float | None = None) -> Future:
+        return self._submit(_process, pdf_bytes, timeout)
+
+    def submit_batch(self, pdfs: list[bytes], timeout: float | None = None) -> Future:
+        return self._submit(_process_batch, pdfs, timeout)
+
+    def _submit(self, function, argument, timeout: float | None) -> Future:
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            metrics.increment("pool_timeouts_total", pool="workers")
+            raise OcrPoolTimeout("fila de OCR cheia")
+        waited = time.monotonic() - start
+        metrics.observe("pool_wait_seconds", waited, "pool_wait", pool="workers")
+        try:
+            future = self._executor.submit(function, argument)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
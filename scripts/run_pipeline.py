@@ -1,19 +1,23 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import json
+import sys
 from pathlib import Path
 
 from enel_ocr.ocr.engine import init_ocr
 from enel_ocr.pipeline import run_pipeline
+from enel_ocr.serialization import invoice_to_dict
 
-PDF_PATH = Path(r"E:\]131313-141411.pdf")
 
-
-def main() -> None:
-    pdf_bytes = PDF_PATH.read_bytes()
+def main(pdf_path: str) -> None:
+    pdf_bytes = Path(pdf_path).read_bytes()
     ocr = init_ocr()
-    run_pipeline(pdf_bytes, ocr)
+    invoice = run_pipeline(pdf_bytes, ocr)
+    print(json.dumps(invoice_to_dict(invoice), ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) != 2:
+        sys.exit("uso: python scripts/run_pipeline.py <fatura.pdf>")
+    main(sys.argv[1])